@@ -0,0 +1,107 @@
+import os
+import sys
+import tarfile
+import tempfile
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+from utils import load_config
+
+CONFIG = load_config()
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+# compute modules that import with the shipped config.yaml
+MODULES = ('experimental_correlation', 'coxhazard_test', 'predictive_power',
+           'hsa_additivity_model', 'find_median_sim', 'preprocessing')
+PLOTTING = ('matplotlib', 'seaborn')
+
+# run in a fresh interpreter, so every import is cold
+PROBE = """import sys, time
+sys.path.insert(0, {src_dir!r})
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(elapsed, int(any(name in sys.modules for name in {plotting!r})))
+"""
+
+
+def time_import(statement: str, src_dir=SRC_DIR, repeat=5) -> tuple:
+    """Time an import statement in fresh interpreters.
+
+    Args:
+        statement (str): import statement, e.g. 'import coxhazard_test'
+        src_dir (str, optional): source directory put on sys.path. Defaults to this directory.
+        repeat (int, optional): number of interpreters to start. Defaults to 5.
+
+    Returns:
+        (float, bool, str): best time (s), whether the plotting stack was imported and
+            the last line of the error if the import failed (None otherwise)
+    """
+    probe = PROBE.format(src_dir=src_dir, statement=statement, plotting=PLOTTING)
+    times = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True)
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()
+            return np.nan, None, error[-1] if error else f'exit code {proc.returncode}'
+        out = proc.stdout.split()
+        times.append(float(out[0]))
+    return min(times), bool(int(out[1])), None
+
+
+def export_src(revision: str, outdir: str) -> str:
+    """Extract src/ of a git revision into outdir and return its path."""
+    archive = os.path.join(outdir, 'src.tar')
+    subprocess.run(['git', 'archive', '-o', archive, revision, 'src'], check=True,
+                   cwd=os.path.dirname(SRC_DIR))
+    with tarfile.open(archive) as tar:
+        tar.extractall(outdir)
+    return os.path.join(outdir, 'src')
+
+
+def benchmark_imports(src_dirs: dict, modules=MODULES, repeat=5) -> pd.DataFrame:
+    """Cold import time of compute modules for each source tree, next to the cost of
+    importing the plotting stack alone.
+
+    Args:
+        src_dirs (dict): label -> source directory
+        modules (tuple, optional): modules to import. Defaults to MODULES.
+        repeat (int, optional): number of interpreters per measurement. Defaults to 5.
+
+    Returns:
+        pd.DataFrame: import time (s), whether matplotlib/seaborn got imported and the
+            error of imports that failed
+    """
+    seconds, _, error = time_import('import matplotlib.pyplot, seaborn', repeat=repeat)
+    rows = [{'module': 'matplotlib.pyplot + seaborn', 'source': '-',
+             'seconds': seconds, 'plotting_imported': error is None, 'error': error}]
+    for module in modules:
+        for label, src_dir in src_dirs.items():
+            seconds, plotting, error = time_import(f'import {module}', src_dir, repeat)
+            rows.append({'module': module, 'source': label, 'seconds': seconds,
+                         'plotting_imported': plotting, 'error': error})
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark cold import time of compute modules')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='Git revision to compare against (e.g. HEAD~1)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of fresh interpreters per measurement')
+    parser.add_argument('--modules', nargs='+', default=MODULES,
+                        help='Modules to import (default: %(default)s)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src_dirs = {'current': SRC_DIR}
+        if args.baseline is not None:
+            src_dirs = {args.baseline: export_src(args.baseline, tmp), **src_dirs}
+        results = benchmark_imports(src_dirs, args.modules, args.repeat)
+    print(results.to_string(index=False))
+    results.to_csv(f"{CONFIG['table_dir']}/import_benchmark.csv", index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from coxhazard_test import create_ipd_arrays, cox_two_arm, IPD_METHODS, _IPD_CACHE
+from reconstruct_ipd import reconstruct_ipd_batch, find_risk_table
+from curve_store import read_curve
+from utils import load_config
+
+CONFIG = load_config()
+
+
+def load_arms(dataset: str) -> dict:
+    """Survival curves of all arms (experimental, control, combination) of a dataset.
+
+    Args:
+        dataset (str): dataset name in config.yaml
+
+    Returns:
+        dict: arm name -> survival data points
+    """
+    config_dict = CONFIG[dataset]
+    metadata = pd.read_csv(config_dict['metadata_sheet_seed'], sep='\t')
+    names = pd.unique(metadata[['Experimental', 'Control', 'Combination']].values.ravel())
+    return {name: read_curve(config_dict['data_dir'], f'{name}.clean').dropna() for name in names}
+
+
+def load_risk_tables(dataset: str) -> dict:
+    """Numbers-at-risk tables of the arms of a dataset (None for arms without one).
+    The control arm uses the control column of its combination trial, experimental
+    and combination arms the treatment column of their own trial.
+
+    Args:
+        dataset (str): dataset name in config.yaml
+
+    Returns:
+        dict: arm name -> numbers at risk (time, nrisk) or None
+    """
+    config_dict = CONFIG[dataset]
+    raw_dir = config_dict.get('raw_dir', config_dict['data_dir'])
+    metadata = pd.read_csv(config_dict['metadata_sheet_seed'], sep='\t')
+    tables = {}
+    for i in metadata.index:
+        name_ab = metadata.at[i, 'Combination']
+        for name, trial, arm in [(metadata.at[i, 'Experimental'], metadata.at[i, 'Experimental'], 'treatment'),
+                                 (metadata.at[i, 'Control'], name_ab, 'control'),
+                                 (name_ab, name_ab, 'treatment')]:
+            if tables.get(name) is None:
+                tables[name] = find_risk_table(raw_dir, trial, arm)
+    return tables
+
+
+def benchmark_ipd(arms: dict, n=500, repeat=3, risk_tables=None) -> pd.DataFrame:
+    """Time IPD construction of all arms by each method (cold cache) and compare
+    each method against the equal-step IPD by a Cox PH test. Arms with a
+    numbers-at-risk table are reconstructed from it by 'guyot'.
+
+    Args:
+        arms (dict): arm name -> survival data points
+        n (int, optional): number of patients per arm. Defaults to 500.
+        repeat (int, optional): number of timed repetitions. Defaults to 3.
+        risk_tables (dict, optional): arm name -> numbers at risk (or None). Defaults to None.
+
+    Returns:
+        pd.DataFrame: per arm HR (method vs equal) and median times
+    """
+    if risk_tables is None:
+        risk_tables = {}
+    dfs = list(arms.values())
+    tables = [risk_tables.get(name) for name in arms]
+    ipds = {}
+    for method in IPD_METHODS:
+        elapsed = []
+        for _ in range(repeat):
+            _IPD_CACHE.clear()
+            start = time.perf_counter()
+            ipds[method] = [create_ipd_arrays(df, n=n, method=method, risk_table=table)
+                            for df, table in zip(dfs, tables)]
+            elapsed.append(time.perf_counter() - start)
+        print(f"{method}: {len(dfs)} arms in {min(elapsed):.3f} s (best of {repeat})")
+    start = time.perf_counter()
+    reconstruct_ipd_batch(dfs, risk_tables=tables, n=n)
+    print(f"reconstruct_ipd_batch: {len(dfs)} arms "
+          f"({sum(table is not None for table in tables)} with a risk table) in {time.perf_counter() - start:.3f} s")
+
+    rows = []
+    for name, table, (t_eq, e_eq), (t_gy, e_gy) in zip(arms, tables, ipds['equal'], ipds['guyot']):
+        p, hr, lower, upper = cox_two_arm(t_eq, e_eq, t_gy, e_gy)
+        rows.append({'arm': name, 'risk_table': table is not None, 'n_guyot': len(t_gy),
+                     'HR_guyot_vs_equal': hr, 'p': p,
+                     'median_event_time_equal': np.median(t_eq[e_eq == 1]) if e_eq.any() else np.nan,
+                     'median_event_time_guyot': np.median(t_gy[e_gy == 1]) if e_gy.any() else np.nan})
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark IPD reconstruction methods')
+    parser.add_argument('dataset', type=str,
+                        help='Dataset to use (PFS, rPFS, waterfall)')
+    parser.add_argument('--n', type=int, default=500, help='Number of patients per arm')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed repetitions')
+    args = parser.parse_args()
+
+    results = benchmark_ipd(load_arms(args.dataset), n=args.n, repeat=args.repeat,
+                            risk_tables=load_risk_tables(args.dataset))
+    print(results.describe())
+    results.to_csv(f"{CONFIG[args.dataset]['table_dir']}/{args.dataset}_ipd_benchmark.csv", index=False)
+
+
+if __name__ == '__main__':
+    main()
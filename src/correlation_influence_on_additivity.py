@@ -5,7 +5,7 @@ import matplotlib.ticker as plticker
 import seaborn as sns
 import yaml
 from scipy.stats import spearmanr
-from lognormal_examples import get_lognormal_examples
+from lognormal_examples import get_lognormal_examples_over_rho
 from coxhazard_test import get_cox_results, create_ipd
 
 with open('config.yaml', 'r') as f:
@@ -27,9 +27,10 @@ def change_in_corr():
     HRlow_arr = np.zeros((len(rho_list), len(models)))
     HRhigh_arr = np.zeros((len(rho_list), len(models)))
 
+    examples = get_lognormal_examples_over_rho(20, 500, 1.2, 1.5, 1, rho_list)
     for rho_idx in range(len(rho_list)):
         rho = rho_list[rho_idx]
-        dic = get_lognormal_examples(20, 500, 1.2, 1.5, 1, rho=rho)
+        dic = examples[rho_idx]
         ipd_control = create_ipd(dic['B'])
         for model_idx in range(len(models)):
             df = dic[models[model_idx]]
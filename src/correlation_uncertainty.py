@@ -1,13 +1,10 @@
 import numpy as np
 import pandas as pd
 from experimental_correlation import get_all_pairs_95_range
-from hsa_additivity_model import predict_both
-from utils import interpolate
-from plotting.plot_correlation_uncertainty import plot_uncertainty_stripplot
-import yaml
+from hsa_additivity_model import predict_over_rho
+from utils import interpolate, load_config
 
-with open('config.yaml', 'r') as f:
-    CONFIG = yaml.safe_load(f)
+CONFIG = load_config()
 
 
 def diff_12month(high_df, low_df):
@@ -92,18 +89,13 @@ def calcualte_uncertainty():
             scan_time = scan_a
             subtracted = 'a'
         
-        ori_corr_hsa, ori_corr_add = predict_both(df_a, df_b, name_a, name_b,
-                                                  subtracted, scan_time,
-                                                  df_ab=df_ab, rho=0.3,
-                                                  seed_ind=seed_ind, seed_add=seed_add)
-        low_corr_hsa, low_corr_add = predict_both(df_a, df_b, name_a, name_b, 
-                                                  subtracted, scan_time,
-                                                  df_ab=df_ab, rho=low_corr, 
-                                                  seed_ind=seed_ind, seed_add=seed_add)
-        high_corr_hsa, high_corr_add = predict_both(df_a, df_b, name_a, name_b,
-                                                    subtracted, scan_time,
-                                                    df_ab=df_ab, rho=high_corr,
-                                                    seed_ind=seed_ind, seed_add=seed_add)
+        # same random draws for all three correlation values, the rho=0.3 row
+        # is the median-seed prediction
+        pred = predict_over_rho(df_a, df_b, [0.3, low_corr, high_corr],
+                                subtracted, scan_time, df_ab=df_ab, rho=0.3,
+                                seed_ind=seed_ind, seed_add=seed_add)
+        ori_corr_hsa, low_corr_hsa, high_corr_hsa = [pred.to_frame('ind', row=k) for k in range(3)]
+        ori_corr_add, low_corr_add, high_corr_add = [pred.to_frame('add', row=k) for k in range(3)]
     
         results.at[i, 'avg_high2low_add'] = diff_average(high_corr_add, low_corr_add)
         results.at[i, 'avg_high2low_HSA'] = diff_average(high_corr_hsa, low_corr_hsa)
@@ -121,6 +113,7 @@ def calcualte_uncertainty():
 
 
 if __name__ == '__main__':
+    from plotting.plot_correlation_uncertainty import plot_uncertainty_stripplot
     results = calcualte_uncertainty()
     fig = plot_uncertainty_stripplot()
     fig.savefig(f"{CONFIG['fig_dir']}/correlation_uncertainty_range95_avg.pdf",
@@ -0,0 +1,191 @@
+import os
+import glob
+import argparse
+import numpy as np
+import pandas as pd
+from utils import LRUCache, load_config
+
+CONFIG = load_config()
+
+STORE_NAME = 'curves.npz'
+CURVE_CACHE_SIZE = 1024
+
+
+class CurveStore:
+    """All curves of a directory in one uncompressed .npz file, keyed by the
+    name of their csv file without extension (e.g. 'Abiraterone_Ryan2015_PFS.clean').
+    Only the header is read when the store is opened; each curve is read on access.
+
+    Args:
+        path (str): path to the .npz file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._npz = np.load(path)
+        self._columns = {}
+        for key in self._npz.files:
+            name, column = key.rsplit('/', 1)
+            self._columns.setdefault(name, []).append(column)
+
+    @property
+    def names(self) -> list:
+        return list(self._columns)
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __len__(self):
+        return len(self._columns)
+
+    def arrays(self, name: str) -> dict:
+        """Columns of one curve as read-only arrays."""
+        out = {}
+        for column in self._columns[name]:
+            arr = self._npz[f'{name}/{column}']
+            arr.setflags(write=False)
+            out[column] = arr
+        return out
+
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        return pd.DataFrame(self.arrays(name))
+
+    def to_csv(self, outdir: str, names=None):
+        """Export curves as {outdir}/{name}.csv (all curves by default)."""
+        for name in (self.names if names is None else names):
+            self[name].to_csv(f'{outdir}/{name}.csv', index=False)
+
+    def close(self):
+        self._npz.close()
+
+
+def write_curve_store(path: str, curves: dict):
+    """Write curves (name -> DataFrame with numeric columns) into one .npz file.
+
+    Args:
+        path (str): path to the .npz file
+        curves (dict): name -> survival data
+    """
+    arrays = {f'{name}/{column}': df[column].to_numpy()
+              for name, df in curves.items() for column in df.columns}
+    tmp = f'{path}.tmp.npz'
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def pack_csvs(directory: str, pattern='*.csv') -> int:
+    """Pack csv files of a directory into {directory}/curves.npz.
+    Files with non-numeric columns are left out (they stay csv only).
+
+    Args:
+        directory (str): directory with csv files
+        pattern (str, optional): glob pattern of files to pack. Defaults to '*.csv'.
+
+    Returns:
+        int: number of packed curves
+    """
+    curves = {}
+    for file in sorted(glob.glob(os.path.join(directory, pattern))):
+        df = pd.read_csv(file)
+        if all(pd.api.types.is_numeric_dtype(dtype) for dtype in df.dtypes):
+            curves[os.path.basename(file)[:-len('.csv')]] = df
+    write_curve_store(os.path.join(directory, STORE_NAME), curves)
+    return len(curves)
+
+
+_STORES = {}
+
+
+def open_store(directory: str):
+    """CurveStore of a directory (None if it has none), reopened when the file changes."""
+    path = os.path.join(directory, STORE_NAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _STORES.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, CurveStore(path))
+        _STORES[path] = cached
+    return cached[1]
+
+
+_CURVES = LRUCache(CURVE_CACHE_SIZE)
+
+
+def curve_arrays(directory: str, name: str) -> dict:
+    """Columns of {directory}/{name}.csv as read-only arrays, from the directory's curve
+    store when it holds the curve and the csv has not been modified after the store was
+    written. Parsed curves are kept in an in-process LRU keyed by source path and mtime,
+    so each file is parsed once per process until it changes.
+
+    Args:
+        directory (str): directory path
+        name (str): file name without .csv
+
+    Returns:
+        dict: column name -> read-only array
+    """
+    store = open_store(directory)
+    csv_path = os.path.join(directory, f'{name}.csv')
+    try:
+        csv_mtime = os.stat(csv_path).st_mtime_ns
+    except FileNotFoundError:
+        csv_mtime = None
+    if store is not None and name in store:
+        store_mtime = os.stat(store.path).st_mtime_ns
+        if csv_mtime is None or csv_mtime <= store_mtime:
+            key = (store.path, store_mtime, name)
+            arrays = _CURVES.get(key)
+            if arrays is None:
+                arrays = store.arrays(name)
+                _CURVES.put(key, arrays)
+            return arrays
+    key = (csv_path, csv_mtime, None)
+    arrays = _CURVES.get(key)
+    if arrays is None:
+        df = pd.read_csv(csv_path)
+        arrays = {column: df[column].to_numpy() for column in df.columns}
+        for arr in arrays.values():
+            arr.setflags(write=False)
+        _CURVES.put(key, arrays)
+    return arrays
+
+
+def read_curve(directory: str, name: str) -> pd.DataFrame:
+    """Read {directory}/{name}.csv through the in-process curve cache (see curve_arrays).
+    Every call returns a new DataFrame, so callers may modify it.
+
+    Args:
+        directory (str): directory path
+        name (str): file name without .csv
+
+    Returns:
+        pd.DataFrame: curve
+    """
+    return pd.DataFrame(curve_arrays(directory, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack clean curves and predictions of a dataset into '
+                                                 f'{STORE_NAME} files, or export them back to csv')
+    parser.add_argument('command', choices=['pack', 'export'])
+    parser.add_argument('dataset', type=str,
+                        help='Dataset to use (PFS, rPFS, waterfall)')
+    args = parser.parse_args()
+    config_dict = CONFIG[args.dataset]
+    directories = [(config_dict['data_dir'], '*.clean.csv'),
+                   (config_dict['pred_dir'], '*_combination_predicted_*.csv')]
+    for directory, pattern in directories:
+        if args.command == 'pack':
+            n = pack_csvs(directory, pattern)
+            print(f'{directory}/{STORE_NAME}: {n} curves')
+        else:
+            store = open_store(directory)
+            if store is not None:
+                store.to_csv(directory)
+                print(f'{directory}: exported {len(store)} curves')
+
+
+if __name__ == '__main__':
+    main()
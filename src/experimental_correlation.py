@@ -1,11 +1,9 @@
 import pandas as pd
 import numpy as np
 from itertools import combinations
-from plotting.plot_experimental_correlation import draw_corr_cell, draw_corr_pdx, draw_ctrp_spearmanr_distribution
-import yaml
+from utils import load_config
 
-with open('config.yaml', 'r') as f:
-    CONFIG = yaml.safe_load(f)
+CONFIG = load_config()
 
 EXPERIMENTAL_DATA_DIR = CONFIG['experimental_dir']
 FIG_DIR = CONFIG['fig_dir']
@@ -198,6 +196,7 @@ def get_distribution_report(all_pairs: np.array, cyto_pairs: np.array,
 
     
 def main():
+    from plotting.plot_experimental_correlation import draw_corr_cell, draw_ctrp_spearmanr_distribution
     # use cell line data (CTRPv2)
     cell_info, drug_info, cancer_type, ctrp = import_ctrp_data()
 
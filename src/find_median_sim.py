@@ -2,40 +2,80 @@ import pandas as pd
 import numpy as np
 from multiprocessing import Pool
 import argparse
-import yaml
 import tempfile
 import os
-from hsa_additivity_model import predict_hsa
+from hsa_additivity_model import predict_hsa, predict_hsa_seeds
+from utils import CORRELATION_METHODS, SharedArrays, init_shared_arrays, shared_array, load_config
+from curve_store import read_curve
 
-with open('config.yaml', 'r') as f:
-    CONFIG = yaml.safe_load(f)
+CONFIG = load_config()
 
 NRUN = 100
 
-def make_prediction_for_each_combo(i: int, indf: pd.DataFrame, data_dir: str, pred_dir: str, waterfall=False):
-    name_a = indf.at[i, 'Experimental']
-    name_b = indf.at[i, 'Control']
-    corr = indf.at[i, 'Corr']  # experimental spearman correlation value
+def publish_arms(indf: pd.DataFrame, data_dir: str) -> tuple:
+    """Read the survival data of every arm in the metadata sheet once and publish it
+    for pool workers (use init_shared_arrays as initializer with initargs=(shared.spec,)).
+
+    Args:
+        indf (pd.DataFrame): metadata sheet
+        data_dir (str): directory path to observed survival data
+
+    Returns:
+        (SharedArrays, dict): published arrays, arm name -> arm id
+    """
+    names = pd.unique(indf[['Experimental', 'Control']].values.ravel())
+    arm_ids = {name: k for k, name in enumerate(names)}
+    arrays = {}
+    for name, k in arm_ids.items():
+        df = read_curve(data_dir, f'{name}.clean')
+        arrays[(k, 'Time')] = df['Time'].to_numpy()
+        arrays[(k, 'Survival')] = df['Survival'].to_numpy()
+    return SharedArrays(arrays), arm_ids
+
 
-    df_a = pd.read_csv(f'{data_dir}/{name_a}.clean.csv',
-                    header=0, index_col=False)
-    df_b = pd.read_csv(f'{data_dir}/{name_b}.clean.csv',
-                    header=0, index_col=False)
+def shared_arm(k: int) -> pd.DataFrame:
+    """Survival data of arm id k inside a worker started with init_shared_arrays."""
+    return pd.DataFrame({'Time': shared_array((k, 'Time')), 'Survival': shared_array((k, 'Survival'))})
 
+
+def _predictions_for_combo(df_a: pd.DataFrame, df_b: pd.DataFrame, name_a: str, name_b: str, corr: float,
+                           pred_dir: str, waterfall=False, method='recursive'):
     for k in range(NRUN):
         seed = k
         ind = predict_hsa(df_a, df_b, name_a, name_b,
                           waterfall=waterfall,
                           rho=corr,
                           seed_ind=seed,
-                          save=False)
+                          save=False,
+                          method=method)
         ind.to_csv(f'{pred_dir}/{name_a}-{name_b}_combination_predicted_ind_run{seed:02d}.csv')
 
 
-def make_predictions_diff_seeds(indf: pd.DataFrame, data_dir: str, pred_dir: str, waterfall=False):
-    args_list = [(i, indf, data_dir, pred_dir, waterfall) for i in indf.index]
-    with Pool(processes=8) as pool:
-        pool.starmap(make_prediction_for_each_combo, args_list)
+def make_prediction_for_each_combo(i: int, indf: pd.DataFrame, data_dir: str, pred_dir: str, waterfall=False,
+                                   method='recursive'):
+    name_a = indf.at[i, 'Experimental']
+    name_b = indf.at[i, 'Control']
+    corr = indf.at[i, 'Corr']  # experimental spearman correlation value
+
+    df_a = read_curve(data_dir, f'{name_a}.clean')
+    df_b = read_curve(data_dir, f'{name_b}.clean')
+    _predictions_for_combo(df_a, df_b, name_a, name_b, corr, pred_dir, waterfall, method)
+
+
+def _shared_predictions_for_combo(id_a: int, id_b: int, name_a: str, name_b: str, corr: float,
+                                  pred_dir: str, waterfall=False, method='recursive'):
+    _predictions_for_combo(shared_arm(id_a), shared_arm(id_b), name_a, name_b, corr,
+                           pred_dir, waterfall, method)
+
+
+def make_predictions_diff_seeds(indf: pd.DataFrame, data_dir: str, pred_dir: str, waterfall=False,
+                                method='recursive'):
+    shared, arm_ids = publish_arms(indf, data_dir)
+    args_list = [(arm_ids[indf.at[i, 'Experimental']], arm_ids[indf.at[i, 'Control']],
+                  indf.at[i, 'Experimental'], indf.at[i, 'Control'], indf.at[i, 'Corr'],
+                  pred_dir, waterfall, method) for i in indf.index]
+    with shared, Pool(processes=8, initializer=init_shared_arrays, initargs=(shared.spec,)) as pool:
+        pool.starmap(_shared_predictions_for_combo, args_list)
 
 
 def find_median_sim(indf: pd.DataFrame, pred_dir: str, save=True, outfile=None) -> pd.DataFrame:
@@ -61,11 +101,106 @@ def find_median_sim(indf: pd.DataFrame, pred_dir: str, save=True, outfile=None)
     return med_df
 
 
-if __name__ == '__main__':
+def median_seed_for_each_combo(i: int, indf: pd.DataFrame, data_dir: str, waterfall=False,
+                               method='recursive', curve_dir=None) -> tuple:
+    """Find the seed whose HSA prediction gives the median of NRUN simulations for one combination.
+    Only the median-time statistic of each seed is kept in memory.
+
+    Args:
+        i (int): row index of the combination in indf
+        indf (pd.DataFrame): metadata sheet
+        data_dir (str): directory path to observed survival data
+        waterfall (bool): use waterfall (best response) model. Defaults to False.
+        method (str): correlation induction method. Defaults to 'recursive'.
+        curve_dir (str): if given, write the full curve of the median seed to this directory. Defaults to None.
+
+    Returns:
+        tuple: (i, standard deviation of the median times, median seed)
+    """
+    name_a = indf.at[i, 'Experimental']
+    name_b = indf.at[i, 'Control']
+    corr = indf.at[i, 'Corr']  # experimental spearman correlation value
+
+    df_a = read_curve(data_dir, f'{name_a}.clean')
+    df_b = read_curve(data_dir, f'{name_b}.clean')
+    return (i,) + _median_seed(df_a, df_b, name_a, name_b, corr, waterfall, method, curve_dir)
+
+
+def _median_seed(df_a: pd.DataFrame, df_b: pd.DataFrame, name_a: str, name_b: str, corr: float,
+                 waterfall=False, method='recursive', curve_dir=None) -> tuple:
+    _, stats = predict_hsa_seeds(df_a, df_b, range(NRUN), waterfall=waterfall,
+                                 rho=corr, method=method)
+    if 'achieved_rho' in stats:
+        print(f"{name_a}-{name_b}: rho={corr:.2f}, achieved {stats['achieved_rho'].min():.3f}"
+              f"-{stats['achieved_rho'].max():.3f} in at most {stats['n_iter'].max()} iterations")
+    ind_arr = stats['median_time'].values
+    # run# of the median
+    ind_idx = np.argsort(ind_arr)[len(ind_arr)//2]
+
+    if curve_dir is not None:
+        ind = predict_hsa(df_a, df_b, name_a, name_b,
+                          waterfall=waterfall,
+                          rho=corr,
+                          seed_ind=ind_idx,
+                          save=False,
+                          method=method)
+        ind.to_csv(f'{curve_dir}/{name_a}-{name_b}_combination_predicted_ind_run{ind_idx:02d}.csv')
+    return (np.std(ind_arr), ind_idx)
+
+
+def _shared_median_seed(i: int, id_a: int, id_b: int, name_a: str, name_b: str, corr: float,
+                        waterfall=False, method='recursive', curve_dir=None) -> tuple:
+    return (i,) + _median_seed(shared_arm(id_a), shared_arm(id_b), name_a, name_b, corr,
+                               waterfall, method, curve_dir)
+
+
+def find_median_sim_in_memory(indf: pd.DataFrame, data_dir: str, waterfall=False, method='recursive',
+                              curve_dir=None, save=True, outfile=None) -> pd.DataFrame:
+    """Same output as make_predictions_diff_seeds followed by find_median_sim, without
+    writing (and re-reading) a csv file for every seed.
+
+    Args:
+        indf (pd.DataFrame): metadata sheet
+        data_dir (str): directory path to observed survival data
+        waterfall (bool): use waterfall (best response) model. Defaults to False.
+        method (str): correlation induction method. Defaults to 'recursive'.
+        curve_dir (str): if given, write the full curve of each median seed to this directory. Defaults to None.
+        save (bool): export metadata sheet with seeds. Defaults to True.
+        outfile (str): output file path. Defaults to None.
+
+    Returns:
+        pd.DataFrame: metadata sheet with ind_median_std and ind_median_run columns
+    """
+    med_df = indf.copy()
+    med_df.loc[:, 'ind_median_std'] = np.nan
+    med_df.loc[:, 'ind_median_run'] = 0
+
+    shared, arm_ids = publish_arms(indf, data_dir)
+    args_list = [(i, arm_ids[indf.at[i, 'Experimental']], arm_ids[indf.at[i, 'Control']],
+                  indf.at[i, 'Experimental'], indf.at[i, 'Control'], indf.at[i, 'Corr'],
+                  waterfall, method, curve_dir) for i in indf.index]
+    with shared, Pool(processes=8, initializer=init_shared_arrays, initargs=(shared.spec,)) as pool:
+        for i, ind_std, ind_idx in pool.starmap(_shared_median_seed, args_list):
+            med_df.loc[i, 'ind_median_std'] = ind_std
+            med_df.loc[i, 'ind_median_run'] = ind_idx
+
+    if save:
+        med_df.to_csv(outfile, index=False, sep='\t')
+
+    return med_df
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('dataset', type=str,
                         help='Dataset to use')
-    args = parser.parse_args()
+    parser.add_argument('--method', type=str, default='recursive', choices=CORRELATION_METHODS,
+                        help='Correlation induction method (default: recursive)')
+    parser.add_argument('--in-memory', action='store_true',
+                        help='Keep only the median statistic of each seed instead of writing every run to csv')
+    parser.add_argument('--curve-dir', type=str, default=None,
+                        help='With --in-memory, write the full curve of the median seed to this directory')
+    args = parser.parse_args(argv)
 
     table_dir = CONFIG['table_dir']
     config_dict = CONFIG[args.dataset]
@@ -75,6 +210,15 @@ if __name__ == '__main__':
     
     indf = pd.read_csv(sheet, sep='\t')
     is_waterfall = (args.dataset == 'waterfall')
-    with tempfile.TemporaryDirectory(dir=table_dir) as temp_dir:
-        make_predictions_diff_seeds(indf, data_dir, temp_dir, waterfall=is_waterfall)
-        find_median_sim(indf, temp_dir, save=True, outfile=outfile)
+    if args.in_memory:
+        find_median_sim_in_memory(indf, data_dir, waterfall=is_waterfall, method=args.method,
+                                  curve_dir=args.curve_dir, save=True, outfile=outfile)
+    else:
+        with tempfile.TemporaryDirectory(dir=table_dir) as temp_dir:
+            make_predictions_diff_seeds(indf, data_dir, temp_dir, waterfall=is_waterfall,
+                                        method=args.method)
+            find_median_sim(indf, temp_dir, save=True, outfile=outfile)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,9 @@
 import numpy as np
 import pandas as pd
-import yaml
-from utils import populate_N_patients
+from utils import populate_N_patients, populate_N_patients_arrays, load_config
 from hsa_additivity_model import subtract_which_scan_time, set_tmax
 
-with open('config.yaml', 'r') as f:
-    CONFIG = yaml.safe_load(f)
+CONFIG = load_config()
 config_dict = CONFIG['approved']
 
 
@@ -13,12 +11,12 @@ def calculate_how_many_benefit_from_additivity(df_baseline: pd.DataFrame,
                                                df_added: pd.DataFrame, scan_time: float, tmax: float) -> float:
     # what proportion of patients have room for added benefit?
     N = 1000
-    baseline = populate_N_patients(df_baseline, N)
-    added = populate_N_patients(df_added, N)
-    room_for_benefit = (baseline['Time'] < tmax).sum() / baseline.shape[0]
+    baseline_time, _ = populate_N_patients_arrays(df_baseline, N)
+    added_time, _ = populate_N_patients_arrays(df_added, N)
+    room_for_benefit = (baseline_time < tmax).sum() / N
     print(room_for_benefit)
     # what proportion of patients had something to add past the first scan time?
-    added_something = (added['Time'] > scan_time).sum() / added.shape[0]
+    added_something = (added_time > scan_time).sum() / N
     print(added_something)
     print()
     return room_for_benefit * added_something
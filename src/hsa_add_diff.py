@@ -1,14 +1,13 @@
 import numpy as np
 import pandas as pd
+from scipy.stats import pearsonr
 from coxhazard_test import get_cox_results, create_ipd
-from utils import interpolate
+from utils import interpolate, load_config
+from curve_store import read_curve
 from lognormal_fitting import fit_lognormal
-from plotting.plot_hsa_add_diff import plot_hsa_add_diff_vs_lognormal, corr_hsa_add_diff_vs_lognormal
 from plotting.plot_utils import import_input_data
-import yaml
 
-with open('config.yaml', 'r') as f:
-    CONFIG = yaml.safe_load(f)
+CONFIG = load_config()
 
 config_dict = CONFIG['approved']
 COMBO_DATA_DIR = config_dict['data_dir']
@@ -35,11 +34,9 @@ def hsa_add_diff():
         name_b = cox_df.at[i, 'Control']
 
         # import data
-        control = pd.read_csv(f'{COMBO_DATA_DIR}/{name_b}.clean.csv')
-        independent = pd.read_csv(
-            f'{PFS_PRED_DIR}/{name_a}-{name_b}_combination_predicted_ind.csv')
-        additive = pd.read_csv(
-            f'{PFS_PRED_DIR}/{name_a}-{name_b}_combination_predicted_add.csv')
+        control = read_curve(COMBO_DATA_DIR, f'{name_b}.clean')
+        independent = read_curve(PFS_PRED_DIR, f'{name_a}-{name_b}_combination_predicted_ind')
+        additive = read_curve(PFS_PRED_DIR, f'{name_a}-{name_b}_combination_predicted_add')
         tmax = np.amin(
             [control['Time'].max(), independent['Time'].max(), additive['Time'].max()])
 
@@ -94,12 +91,10 @@ def added_benefit_hsa_add_syn():
         name_ab = cox_df.at[i, 'Combination']
 
         # import data
-        control = pd.read_csv(f'{COMBO_DATA_DIR}/{name_b}.clean.csv')
-        obs_combo = pd.read_csv(f'{COMBO_DATA_DIR}/{name_ab}.clean.csv')
-        independent = pd.read_csv(
-            f'{PFS_PRED_DIR}/{name_a}-{name_b}_combination_predicted_ind.csv')
-        additive = pd.read_csv(
-            f'{PFS_PRED_DIR}/{name_a}-{name_b}_combination_predicted_add.csv')
+        control = read_curve(COMBO_DATA_DIR, f'{name_b}.clean')
+        obs_combo = read_curve(COMBO_DATA_DIR, f'{name_ab}.clean')
+        independent = read_curve(PFS_PRED_DIR, f'{name_a}-{name_b}_combination_predicted_ind')
+        additive = read_curve(PFS_PRED_DIR, f'{name_a}-{name_b}_combination_predicted_add')
         tmax = np.amin(
             [control['Time'].max(), independent['Time'].max(), additive['Time'].max()])
         f_ctrl = interpolate(control, x='Time', y='Survival')
@@ -120,6 +115,23 @@ def added_benefit_hsa_add_syn():
     return diff_df
 
 
+def corr_hsa_add_diff_vs_lognormal(lognorm_df, diff_df):
+    """Perform Pearson correlation between average standard deviation
+    of log-normal fit vs. HR(additivity vs. HSA).
+
+    Args:
+        lognorm_df (pd.DataFrame): log-normal parameters of combinations
+        diff_df (pd.DataFrame): HSA additivity difference
+
+    Returns:
+        LinregressResult: contains slope, intercept, rvalue, pvalue
+    """
+    avg_sigma = np.sqrt(
+        (lognorm_df['sigma_a']**2 + lognorm_df['sigma_b']**2)/2)
+    r, p = pearsonr(avg_sigma, np.log(diff_df['HR']))
+    return r, p
+
+
 def main():
     added_df = added_benefit_hsa_add_syn()
     added_df.round(5).to_csv(
@@ -128,6 +140,7 @@ def main():
     diff_df = hsa_add_diff()
     r, p = corr_hsa_add_diff_vs_lognormal(lognorm_df, diff_df)
     print(f'pearsonr={r}\npvalue={p}')
+    from plotting.plot_hsa_add_diff import plot_hsa_add_diff_vs_lognormal
     fig = plot_hsa_add_diff_vs_lognormal(lognorm_df, diff_df)
     fig.savefig(f'{FIG_DIR}/hsa_additivity_sigma.pdf')
 
@@ -1,12 +1,13 @@
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from utils import populate_N_patients, fit_rho3
-import yaml
+from utils import (populate_N_patients_arrays, shuffle_correlated, fit_rho3_batch, fit_rho3_over_rho,
+                   fit_rho_iman_conover, CORRELATION_METHODS, load_config)
+from curve_store import read_curve
+from prediction_tensor import combo_key, write_prediction_tensor
 import argparse
 
-with open('config.yaml', 'r') as f:
-    CONFIG = yaml.safe_load(f)
+CONFIG = load_config()
 
 def sample_joint_response_add(ori_a: pd.DataFrame, ori_b: pd.DataFrame, 
                               subtracted: str, scan_time: float) -> list:
@@ -69,9 +70,133 @@ def set_tmax(df_a: pd.DataFrame, df_b: pd.DataFrame, df_ab: pd.DataFrame) -> flo
         tmax = min(df_a['Time'].max(), df_b['Time'].max())
     return tmax
 
+class PredictionResult:
+    """Array-native HSA/additivity prediction. All models (and all results predicted from the
+    same experimental arm and N) share one read-only survival grid, the populated survival of
+    the experimental arm, and each model only stores its array of predicted times.
+
+    Args:
+        survival (np.ndarray): survival (%) of the N virtual patients (increasing)
+        **times (np.ndarray): predicted times per model, e.g. ind=..., add=...; 
+                              shape (N,) or (R, N) for R stacked predictions
+
+    Attributes:
+        stats (dict): shuffling diagnostics per model ({'achieved_rho': ..., 'n_iter': ...})
+    """
+
+    def __init__(self, survival: np.ndarray, **times):
+        self.survival = survival
+        self.stats = {}
+        self.times = {}
+        for model, arr in times.items():
+            arr = np.asarray(arr, dtype=np.float64)
+            arr.setflags(write=False)
+            self.times[model] = arr
+
+    def __getitem__(self, model: str) -> np.ndarray:
+        return self.times[model]
+
+    @property
+    def models(self) -> list:
+        return list(self.times.keys())
+
+    def to_frame(self, model: str, row=None) -> pd.DataFrame:
+        """Convert one model prediction to the Time/Survival DataFrame returned by predict_both.
+
+        Args:
+            model (str): model name (e.g. 'ind' or 'add')
+            row (int, optional): row of stacked predictions (e.g. rho index). Defaults to None.
+
+        Returns:
+            pd.DataFrame: survival data with N data points
+        """
+        times = self.times[model]
+        if row is not None:
+            times = times[row]
+        return pd.DataFrame({'Time': times, 'Survival': self.survival})
+
+    def save(self, name_a: str, name_b: str, outdir=None):
+        """Export every model prediction to {name_a}-{name_b}_combination_predicted_{model}.csv.
+
+        Args:
+            name_a (str): treatment A name
+            name_b (str): treatment B name
+            outdir (str): directory to save exported data. If None, save in current directory. Defaults to None.
+        """
+        prefix = f'{name_a}-{name_b}' if outdir is None else f'{outdir}/{name_a}-{name_b}'
+        for model in self.times:
+            self.to_frame(model).round(5).to_csv(f'{prefix}_combination_predicted_{model}.csv',
+                                                 index=False)
+
+
+def _sort_and_clip(times: np.ndarray, tmax: float) -> np.ndarray:
+    """Sort predicted times (along the last axis) in decreasing order (= increasing survival) 
+    and clip to tmax in place."""
+    times.sort(axis=-1)
+    times = times[..., ::-1]
+    np.minimum(times, tmax, out=times)
+    return times
+
+
+def _additivity_times(new_a: np.ndarray, new_b: np.ndarray, subtracted: str, scan_time: float) -> np.ndarray:
+    """Unsorted additivity prediction from shuffled arms (same rule as sample_joint_response_add)."""
+    if subtracted not in ('a', 'b'):
+        raise ValueError(f"subtracted must be 'a' or 'b', got '{subtracted}'")
+    # ensure that a + b > a and a + b > b
+    if subtracted == 'a':
+        adjusted = new_a - scan_time
+        np.maximum(adjusted, 0, out=adjusted)
+        adjusted += new_b
+        return np.maximum(adjusted, new_a, out=adjusted)
+    adjusted = new_b - scan_time
+    np.maximum(adjusted, 0, out=adjusted)
+    adjusted += new_a
+    return np.maximum(adjusted, new_b, out=adjusted)
+
+
+def predict_both_arrays(a_time: np.ndarray, b_time: np.ndarray, subtracted: str, scan_time: float,
+                        tmax: float, rho=0.3, seed_ind=0, seed_add=0, method='recursive',
+                        full_output=False) -> tuple:
+    """ Fused HSA and additivity prediction on populated patient arrays, without intermediate DataFrames.
+    Each model is shuffled with its own random generator seed as in predict_both.
+
+    Args:
+        a_time (np.ndarray): populated survival times for treatment A (Experimental)
+        b_time (np.ndarray): populated survival times for treatment B (Control)
+        subtracted (str): treatment arm to substract first scan time from ('a' or 'b')
+        scan_time (float): first scan time
+        tmax (float): maximum follow-up time
+        rho (float, optional): correlation value. Defaults to 0.3.
+        seed_ind (int): random generator seed for independent model. Defaults to 0.
+        seed_add (int): random generator seed for additivity model. Defaults to 0.
+        method (str): correlation induction method ('recursive' or 'iman_conover'). Defaults to 'recursive'.
+        full_output (bool): also return the shuffling diagnostics of each model. Defaults to False.
+
+    Returns:
+        np.ndarray : HSA predicted times, in increasing survival order
+        np.ndarray : additivity predicted times, in increasing survival order
+        dict : (if full_output) model -> {'achieved_rho': ..., 'n_iter': ...}
+    """
+    rng_ind = np.random.default_rng(seed_ind)
+    ind_a, ind_b, rho_ind, iter_ind = shuffle_correlated(a_time, b_time, rho, rng_ind, method=method,
+                                                         full_output=True)
+    independent = _sort_and_clip(np.maximum(ind_a, ind_b), tmax)
+
+    rng_add = np.random.default_rng(seed_add)
+    add_a, add_b, rho_add, iter_add = shuffle_correlated(a_time, b_time, rho, rng_add, method=method,
+                                                         full_output=True)
+    additivity = _sort_and_clip(_additivity_times(add_a, add_b, subtracted, scan_time), tmax)
+    if full_output:
+        stats = {'ind': {'achieved_rho': rho_ind, 'n_iter': iter_ind},
+                 'add': {'achieved_rho': rho_add, 'n_iter': iter_add}}
+        return (independent, additivity, stats)
+    return (independent, additivity)
+
+
 def predict_both(df_a: pd.DataFrame, df_b: pd.DataFrame, 
                  name_a: str, name_b: str, subtracted: str, scan_time: float, 
-                 df_ab=None, N=5000, rho=0.3, seed_ind=0, seed_add=0, save=True, outdir=None) -> tuple:
+                 df_ab=None, N=5000, rho=0.3, seed_ind=0, seed_add=0, save=True, outdir=None,
+                 method='recursive', as_array=False):
     """ Predict combination effect using HSA and additivity model and writes csv output.
 
     Args:
@@ -88,54 +213,102 @@ def predict_both(df_a: pd.DataFrame, df_b: pd.DataFrame,
         seed_add (int): random generator seed for additivity model. Defaults to 0.
         save (bool): export data to csv. Defaults to True.
         outdir (str): directory to save exported data. If None, save in current directory. Defaults to None. 
+        method (str): correlation induction method ('recursive' or 'iman_conover'). Defaults to 'recursive'.
+        as_array (bool): return a PredictionResult with models 'ind' and 'add' and their achieved
+            rho and number of iterations in stats. Defaults to False.
     
     Returns:
         pd.DataFrame : HSA prediction
         pd.DataFrame : additivity prediction
     """
-    a = populate_N_patients(df_a, N)
-    b = populate_N_patients(df_b, N)
-    
-    patients = a['Survival'].values
-    rng_ind = np.random.default_rng(seed_ind)
-    new_ind_a, new_ind_b = fit_rho3(a['Time'].values, b['Time'].values, rho, rng_ind)
-    independent = pd.DataFrame({'Time': sample_joint_response(new_ind_a, new_ind_b), 
-                                'Survival': patients})
-    
-    rng_add = np.random.default_rng(seed_add)
-    new_add_a, new_add_b = fit_rho3(a['Time'].values, b['Time'].values, rho, rng_add)
-    additivity = pd.DataFrame({'Time': sample_joint_response_add(new_add_a, new_add_b, subtracted, scan_time),
-                               'Survival': patients})
+    a_time, patients = populate_N_patients_arrays(df_a, N)
+    b_time, _ = populate_N_patients_arrays(df_b, N)
 
-    additivity = additivity.sort_values('Survival', ascending=True).reset_index(drop=True)
-    independent = independent.sort_values('Survival', ascending=True).reset_index(drop=True)
-    
     if df_ab is not None:
         tmax = set_tmax(df_a, df_b, df_ab)
     else:
         tmax = min(df_a['Time'].max(), df_b['Time'].max())
-    
-    independent.loc[independent['Time'] > tmax, 'Time'] = tmax
-    additivity.loc[additivity['Time'] > tmax, 'Time'] = tmax
+
+    ind_time, add_time, stats = predict_both_arrays(a_time, b_time, subtracted, scan_time, tmax,
+                                                    rho=rho, seed_ind=seed_ind, seed_add=seed_add,
+                                                    method=method, full_output=True)
+    result = PredictionResult(patients, ind=ind_time, add=add_time)
+    result.stats.update(stats)
 
     if save == True:
-        if outdir is not None:
-            additivity.round(5).to_csv(f'{outdir}/{name_a}-{name_b}_combination_predicted_add.csv', 
-                                    index=False)
-            independent.round(5).to_csv(f'{outdir}/{name_a}-{name_b}_combination_predicted_ind.csv',
-                                        index=False)
-        else:
-            additivity.round(5).to_csv(f'{name_a}-{name_b}_combination_predicted_add.csv', 
-                                    index=False)
-            independent.round(5).to_csv(f'{name_a}-{name_b}_combination_predicted_ind.csv',
-                                        index=False)
-    
-    return (independent, additivity)
+        result.save(name_a, name_b, outdir=outdir)
+
+    if as_array:
+        return result
+    return (result.to_frame('ind'), result.to_frame('add'))
+
+
+def _shuffle_over_rho(a_time: np.ndarray, b_time: np.ndarray, rhos, seed: int, ref_rho: float,
+                      method: str) -> tuple:
+    """Shuffled arms for each rho (rho x patient) with common random numbers across rho,
+    followed by the shuffling diagnostics ({'achieved_rho': ..., 'n_iter': ...}, one per rho)."""
+    if method == 'recursive':
+        x1, x2, achieved, n_iter = fit_rho3_over_rho(a_time, b_time, rhos, np.random.default_rng(seed),
+                                                     ref_rho=ref_rho, full_output=True)
+        return (x1, x2, {'achieved_rho': achieved, 'n_iter': n_iter})
+    elif method == 'iman_conover':
+        # the scores are permuted once per generator, so each rho mixes the same draws
+        shuffled = [fit_rho_iman_conover(a_time, b_time, r, np.random.default_rng(seed))
+                    for r in rhos]
+        return (np.stack([x1 for x1, _, _, _ in shuffled]),
+                np.stack([x2 for _, x2, _, _ in shuffled]),
+                {'achieved_rho': np.array([r for _, _, r, _ in shuffled]),
+                 'n_iter': np.array([k for _, _, _, k in shuffled])})
+    raise ValueError(f"method must be one of {CORRELATION_METHODS}, got '{method}'")
+
+
+def predict_over_rho(df_a: pd.DataFrame, df_b: pd.DataFrame, rhos, subtracted: str, scan_time: float,
+                     df_ab=None, N=5000, rho=0.3, seed_ind=0, seed_add=0,
+                     method='recursive') -> PredictionResult:
+    """ Predict combination effect using HSA and additivity model for several correlation values.
+    The arms are populated once and each model reuses the same standard normal draws for
+    every rho (common random numbers), so curves differ between rho values only because of rho.
+    Rows at the reference correlation rho are the curves of predict_both with the same seeds.
+
+    Args:
+        df_a (pd.DataFrame): survival data for treatment A (Experimental)
+        df_b (pd.DataFrame): survival data for treatment B (Control)
+        rhos (array_like): correlation values
+        subtracted (str): treatment arm to substract first scan time from ('a' or 'b')
+        scan_time (float): first scan time
+        df_ab (pd.DataFrame, optional): survival data for treatment A+B. Defaults to None.
+        N (int, optional): number of virtual patients. Defaults to 5000.
+        rho (float, optional): reference correlation value. Defaults to 0.3.
+        seed_ind (int): random generator seed for independent model. Defaults to 0.
+        seed_add (int): random generator seed for additivity model. Defaults to 0.
+        method (str): correlation induction method ('recursive' or 'iman_conover'). Defaults to 'recursive'.
+
+    Returns:
+        PredictionResult : (rho x patient) predicted times for models 'ind' and 'add', with
+            the achieved rho and number of iterations of each row in stats
+    """
+    a_time, patients = populate_N_patients_arrays(df_a, N)
+    b_time, _ = populate_N_patients_arrays(df_b, N)
+
+    if df_ab is not None:
+        tmax = set_tmax(df_a, df_b, df_ab)
+    else:
+        tmax = min(df_a['Time'].max(), df_b['Time'].max())
+
+    ind_a, ind_b, stats_ind = _shuffle_over_rho(a_time, b_time, rhos, seed_ind, rho, method)
+    independent = _sort_and_clip(np.maximum(ind_a, ind_b), tmax)
+
+    add_a, add_b, stats_add = _shuffle_over_rho(a_time, b_time, rhos, seed_add, rho, method)
+    additivity = _sort_and_clip(_additivity_times(add_a, add_b, subtracted, scan_time), tmax)
+    result = PredictionResult(patients, ind=independent, add=additivity)
+    result.stats.update(ind=stats_ind, add=stats_add)
+    return result
 
 
 def predict_hsa(df_a: pd.DataFrame, df_b: pd.DataFrame,
                 name_a: str, name_b: str,
-                df_ab=None, waterfall=False, N=5000, rho=0.3, seed_ind=0, save=True, outdir=None) -> tuple:
+                df_ab=None, waterfall=False, N=5000, rho=0.3, seed_ind=0, save=True, outdir=None,
+                method='recursive', as_array=False):
     """ Predict combination effect using HSA model and writes csv output.
 
     Args:
@@ -149,40 +322,95 @@ def predict_hsa(df_a: pd.DataFrame, df_b: pd.DataFrame,
         seed_ind (int): random generator seed for independent model. Defaults to 0.
         save (bool): export data to csv. Defaults to True.
         outdir (str): directory to save exported data. If None, save in current directory. Defaults to None. 
+        method (str): correlation induction method ('recursive' or 'iman_conover'). Defaults to 'recursive'.
+        as_array (bool): return a PredictionResult with model 'ind' and its achieved rho and
+            number of iterations in stats['ind']. Defaults to False.
     
     Returns:
         pd.DataFrame : HSA prediction
     """
-    a = populate_N_patients(df_a, N)
-    b = populate_N_patients(df_b, N)
-
-    patients = a['Survival'].values
-    rng_ind = np.random.default_rng(seed_ind)
-    new_ind_a, new_ind_b = fit_rho3(
-        a['Time'].values, b['Time'].values, rho, rng_ind)
-    independent = pd.DataFrame({'Time': sample_joint_response(new_ind_a, new_ind_b, waterfall=waterfall),
-                                'Survival': patients})
-
-    
-    independent = independent.sort_values(
-        'Survival', ascending=True).reset_index(drop=True)
+    a_time, patients = populate_N_patients_arrays(df_a, N)
+    b_time, _ = populate_N_patients_arrays(df_b, N)
 
     if df_ab is not None:
         tmax = set_tmax(df_a, df_b, df_ab)
     else:
         tmax = min(df_a['Time'].max(), df_b['Time'].max())
 
-    independent.loc[independent['Time'] > tmax, 'Time'] = tmax
+    rng_ind = np.random.default_rng(seed_ind)
+    new_ind_a, new_ind_b, achieved_rho, n_iter = shuffle_correlated(
+        a_time, b_time, rho, rng_ind, method=method, full_output=True)
+    if waterfall:
+        ind_time = np.minimum(new_ind_a, new_ind_b)
+    else:
+        ind_time = np.maximum(new_ind_a, new_ind_b)
+    result = PredictionResult(patients, ind=_sort_and_clip(ind_time, tmax))
+    result.stats['ind'] = {'achieved_rho': achieved_rho, 'n_iter': n_iter}
 
     if save == True:
-        if outdir is not None:
-            independent.round(5).to_csv(f'{outdir}/{name_a}-{name_b}_combination_predicted_ind.csv',
-                                        index=False)
-        else:
-            independent.round(5).to_csv(f'{name_a}-{name_b}_combination_predicted_ind.csv',
-                                        index=False)
+        result.save(name_a, name_b, outdir=outdir)
+
+    if as_array:
+        return result
+    return result.to_frame('ind')
+
 
-    return independent
+def predict_hsa_seeds(df_a: pd.DataFrame, df_b: pd.DataFrame, seeds,
+                      df_ab=None, waterfall=False, N=5000, rho=0.3, method='recursive') -> tuple:
+    """ Predict combination effect using HSA model for many random generator seeds at once.
+    The arms are populated once and all seeds are shuffled in one batch, so row k equals
+    predict_hsa(..., seed_ind=seeds[k], save=False)['Time'].
+
+    Args:
+        df_a (pd.DataFrame): survival data for treatment A (Experimental)
+        df_b (pd.DataFrame): survival data for treatment B (Control)
+        seeds (array_like): random generator seeds for independent model
+        df_ab (pd.DataFrame, optional): survival data for treatment A+B. Defaults to None.
+        waterfall (bool): predict best response of waterfall data. Defaults to False.
+        N (int, optional): number of virtual patients. Defaults to 5000.
+        rho (float, optional): correlation value. Defaults to 0.3.
+        method (str): correlation induction method ('recursive' or 'iman_conover'). Defaults to 'recursive'.
+
+    Returns:
+        np.ndarray : (seed x patient) array of predicted times, ordered by increasing survival
+        pd.DataFrame : per-seed summary statistics (seed, median_time, mean_time, and for
+            'iman_conover' the achieved_rho and n_iter of fit_rho_iman_conover)
+    """
+    a_time, _ = populate_N_patients_arrays(df_a, N)
+    b_time, _ = populate_N_patients_arrays(df_b, N)
+    seeds = list(seeds)
+
+    diagnostics = {}
+    if method == 'recursive':
+        new_a, new_b = fit_rho3_batch(a_time, b_time, rho, seeds)
+    else:
+        shuffled = [fit_rho_iman_conover(a_time, b_time, rho, np.random.default_rng(seed))
+                    for seed in seeds]
+        new_a = np.stack([x1 for x1, _, _, _ in shuffled])
+        new_b = np.stack([x2 for _, x2, _, _ in shuffled])
+        diagnostics = {'achieved_rho': [r for _, _, r, _ in shuffled],
+                       'n_iter': [k for _, _, _, k in shuffled]}
+
+    if waterfall:
+        times = np.minimum(new_a, new_b)
+    else:
+        times = np.maximum(new_a, new_b)
+    # sort in decreasing time (= increasing survival)
+    times.sort(axis=1)
+    times = times[:, ::-1]
+
+    if df_ab is not None:
+        tmax = set_tmax(df_a, df_b, df_ab)
+    else:
+        tmax = min(df_a['Time'].max(), df_b['Time'].max())
+    times = np.minimum(times, tmax)
+
+    mid = N // 2
+    stats = pd.DataFrame({'seed': seeds,
+                          'median_time': times[:, mid - 1:mid + 1].mean(axis=1),
+                          'mean_time': times.mean(axis=1),
+                          **diagnostics})
+    return (times, stats)
 
 
 def subtract_which_scan_time(scan_a: float, scan_b: float) -> tuple:
@@ -208,11 +436,13 @@ def subtract_which_scan_time(scan_a: float, scan_b: float) -> tuple:
     return (subtracted, scan_time)
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('dataset', type=str, 
                         help='Dataset to use (PFS, rPFS, waterfall)')
-    args = parser.parse_args()
+    parser.add_argument('--method', type=str, default='recursive', choices=CORRELATION_METHODS,
+                        help='Correlation induction method (default: recursive)')
+    args = parser.parse_args(argv)
     
     config_dict = CONFIG[args.dataset]
     sheet = config_dict['metadata_sheet_seed']
@@ -223,19 +453,26 @@ def main():
 
     is_waterfall = (args.dataset == 'waterfall')
 
+    combos, results = [], []
     for i in indf.index:
         name_a = indf.at[i, 'Experimental']
         name_b = indf.at[i, 'Control']
         corr = indf.at[i, 'Corr']  # experimental spearman correlation value
         # random generator seed that results in median of 100 simulations
         seed_ind = indf.at[i, 'ind_median_run']
-        df_a = pd.read_csv(f'{data_dir}/{name_a}.clean.csv',
-                           header=0, index_col=False)
-        df_b = pd.read_csv(f'{data_dir}/{name_b}.clean.csv',
-                           header=0, index_col=False)
-
-        predict_hsa(df_a, df_b, name_a, name_b,
-                     df_ab=None, waterfall=is_waterfall, rho=corr, seed_ind=seed_ind, outdir=pred_dir)
+        df_a = read_curve(data_dir, f'{name_a}.clean')
+        df_b = read_curve(data_dir, f'{name_b}.clean')
+
+        result = predict_hsa(df_a, df_b, name_a, name_b,
+                             df_ab=None, waterfall=is_waterfall, rho=corr, seed_ind=seed_ind, outdir=pred_dir,
+                             method=args.method, as_array=True)
+        stats = result.stats['ind']
+        print(f"{name_a}-{name_b}: rho={corr:.2f}, achieved {stats['achieved_rho']:.3f} "
+              f"in {stats['n_iter']} iterations")
+        combos.append(combo_key(name_a, name_b))
+        results.append(result)
+
+    write_prediction_tensor(pred_dir, combos, results)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,12 @@
 import numpy as np
 import pandas as pd
 from lognormal_fitting import lognormal_survival
-from hsa_additivity_model import predict_both
-from plotting.plot_lognormal_examples import plot_lognormal_examples
-import yaml
+from hsa_additivity_model import predict_both, predict_over_rho
+from utils import load_config
 import warnings
 
 
-with open('config.yaml', 'r') as f:
-    CONFIG = yaml.safe_load(f)
+CONFIG = load_config()
 
 FIG_DIR = CONFIG['approved']['fig_dir']
 
@@ -55,7 +53,36 @@ def get_lognormal_examples(tmax, n, mu_a, mu_b, sigma, rho=0.3):
     return {'A': drugA, 'B': drugB, 'HSA': hsa, 'Additivity': add}
 
 
+def get_lognormal_examples_over_rho(tmax, n, mu_a, mu_b, sigma, rhos):
+    """Same as get_lognormal_examples for several Spearman rho values, 
+    using common random numbers across rho values.
+
+    Args:
+        tmax (float): maximum follow-up time
+        n (int): number of datapoints
+        mu_a (float): mean of lognomral distribution for drug A
+        mu_b (float): mean of lognomral distribution for drug B
+        sigma (float): standard deviation of lognormal distribution
+        rhos (array_like): Spearman rho values for two drug responses.
+
+    Returns:
+        list: dictonary of dataframes for A, B, HSA, and Additivity for each rho.
+    """    
+    drugA = get_lognorm_survival_dataframe(tmax, n, mu_a, sigma)
+    drugB = get_lognorm_survival_dataframe(tmax, n, mu_b, sigma)
+    pred = predict_over_rho(drugA, drugB, rhos, 'a', 1, N=500)
+    # add starting point (survival=100, time=0)
+    patients = np.append(pred.survival, 100)
+    examples = []
+    for hsa_time, add_time in zip(pred['ind'], pred['add']):
+        hsa = pd.DataFrame({'Time': np.append(hsa_time, 0), 'Survival': patients})
+        add = pd.DataFrame({'Time': np.append(add_time, 0), 'Survival': patients})
+        examples.append({'A': drugA, 'B': drugB, 'HSA': hsa, 'Additivity': add})
+    return examples
+
+
 def main():
+    from plotting.plot_lognormal_examples import plot_lognormal_examples
     less_variable = get_lognormal_examples(20, 500, 2, 2.2, 0.5)
     more_variable = get_lognormal_examples(20, 500, 1, 1.5, 2)
     fig = plot_lognormal_examples(less_variable, more_variable)
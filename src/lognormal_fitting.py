@@ -3,10 +3,10 @@ import pandas as pd
 from scipy.stats import norm
 from scipy.optimize import curve_fit
 from plotting.plot_utils import import_input_data
-import yaml
+from curve_store import read_curve
+from utils import load_config
 
-with open('config.yaml', 'r') as f:
-    CONFIG = yaml.safe_load(f)
+CONFIG = load_config()
 
 COMBO_DATA_DIR = CONFIG['approved']['data_dir']
 
@@ -53,8 +53,8 @@ def fit_lognormal():
         name_b = cox_df.at[i, 'Control']
 
         # import data
-        df_a = pd.read_csv(f'{COMBO_DATA_DIR}/{name_a}.clean.csv')
-        df_b = pd.read_csv(f'{COMBO_DATA_DIR}/{name_b}.clean.csv')
+        df_a = read_curve(COMBO_DATA_DIR, f'{name_a}.clean')
+        df_b = read_curve(COMBO_DATA_DIR, f'{name_b}.clean')
 
         popt_a, cov_a = curve_fit(
             lognormal_survival, df_a['Time'], df_a['Survival']/100)
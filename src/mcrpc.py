@@ -0,0 +1,90 @@
+import time
+import shlex
+import argparse
+import importlib
+from utils import load_config
+
+CONFIG = load_config()
+
+DATASETS = ('PFS', 'rPFS', 'waterfall')
+
+# stage -> (module with main(argv), default datasets, default options)
+STAGES = {
+    'preprocess': ('preprocessing', DATASETS, []),
+    'find-seeds': ('find_median_sim', DATASETS, ['--in-memory']),
+    'predict': ('hsa_additivity_model', DATASETS, []),
+    'cox': ('coxhazard_test', ('PFS', 'rPFS'), []),
+    'power': ('predictive_power', ('PFS', 'rPFS'), []),
+    'plots': ('plotting.plot_survival_curves_suppl', DATASETS, []),
+}
+
+
+def run_stage(stage: str, datasets=None, options=()):
+    """Run one pipeline stage for each dataset in this interpreter. Modules are imported
+    on first use, so chained stages share imported libraries, the parsed config and
+    in-process caches (curves, IPDs, Cox results).
+
+    Args:
+        stage (str): stage name (key of STAGES)
+        datasets (list, optional): datasets to run. Defaults to the stage's datasets.
+        options (list, optional): extra command line options passed to the stage. Defaults to ().
+    """
+    module_name, default_datasets, default_options = STAGES[stage]
+    datasets = default_datasets if datasets is None else datasets
+    if not datasets:
+        raise ValueError(f'{stage}: no dataset configured for this stage, pass --datasets')
+    module = importlib.import_module(module_name)
+    for dataset in datasets:
+        start = time.perf_counter()
+        module.main([dataset, *default_options, *options])
+        print(f'{stage} {dataset}: {time.perf_counter() - start:.1f} s')
+
+
+def stage_spec(value: str) -> tuple:
+    """Parse a STAGE or STAGE:DATASET,... argument into (stage, datasets or None)."""
+    stage, sep, datasets = value.partition(':')
+    if stage not in STAGES:
+        raise argparse.ArgumentTypeError(
+            f"invalid stage '{stage}' (choose from {', '.join(STAGES)})")
+    if not sep:
+        return (stage, None)
+    datasets = [d for d in datasets.split(',') if d]
+    if not datasets:
+        raise argparse.ArgumentTypeError(f"no dataset given after '{stage}:'")
+    return (stage, datasets)
+
+
+def stage_options(value: str) -> tuple:
+    """Parse a STAGE=OPTIONS argument into (stage, list of options)."""
+    stage, sep, options = value.partition('=')
+    if not sep or stage not in STAGES:
+        raise argparse.ArgumentTypeError(
+            f"expected STAGE=OPTIONS with STAGE one of {', '.join(STAGES)}, got '{value}'")
+    return (stage, shlex.split(options))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run pipeline stages in one process, in the given order',
+        epilog='e.g. mcrpc.py predict cox:PFS power --datasets PFS rPFS '
+               '--stage-options "power=--workers 8"')
+    parser.add_argument('stages', nargs='+', type=stage_spec, metavar='STAGE[:DATASET,...]',
+                        help=f"Stages to run ({', '.join(STAGES)}), "
+                             'optionally with their own comma-separated datasets')
+    parser.add_argument('--datasets', nargs='+', default=None,
+                        help='Datasets to run stages without their own datasets on '
+                             '(default: the datasets of each stage)')
+    parser.add_argument('--stage-options', type=stage_options, action='append', default=[],
+                        metavar='STAGE=OPTIONS',
+                        help='Command line options passed to one stage only (repeatable)')
+    args = parser.parse_args(argv)
+
+    options = {stage: [] for stage in STAGES}
+    for stage, stage_opts in args.stage_options:
+        options[stage].extend(stage_opts)
+    for stage, datasets in args.stages:
+        run_stage(stage, args.datasets if datasets is None else datasets, options[stage])
+
+
+if __name__ == '__main__':
+    main()
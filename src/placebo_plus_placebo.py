@@ -1,6 +1,6 @@
 from pathlib import Path
 import pandas as pd
-from hsa_additivity_model import predict_both
+from hsa_additivity_model import predict_over_rho
 
 
 
@@ -12,9 +12,11 @@ def placebo_plus_pacebo():
         file_prefix = placebo_input.at[i, 'File prefix']
         placebo = pd.read_csv(placebo_path + file_prefix + '.clean.csv')
         scan_time = placebo_input.at[i, 'First scan time (months)']
-        for rho in [0.3, 0.6, 1]:
-            hsa, add = predict_both(placebo, placebo, 'Placebo_A', 'Placebo_B', 'a', 
-                                    scan_time, rho=rho)
+        rhos = [0.3, 0.6, 1]
+        pred = predict_over_rho(placebo, placebo, rhos, 'a', scan_time)
+        for k, rho in enumerate(rhos):
+            hsa = pred.to_frame('ind', row=k)
+            add = pred.to_frame('add', row=k)
             hsa.round(5).to_csv(f'../analysis/placebo_plus_placebo/{file_prefix}_hsa_{rho}.csv',
                                 index=False)
             add.round(5).to_csv(f'../analysis/placebo_plus_placebo/{file_prefix}_add_{rho}.csv',
@@ -1,8 +1,15 @@
+import os
+import sys
+if __name__ == '__main__':
+    # run as a script from src/plotting: make the modules in src/ importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from plot_utils import import_input_data, set_figsize, interpolate
+from curve_store import read_curve
+from prediction_tensor import read_prediction
 import warnings
 import yaml
 
@@ -78,8 +85,8 @@ def plot_all_survival_qqplot() -> plt.figure:
         ind_color = pal[custom_dict[tmp.at[i, 'ind_label']]]
 
         # import data
-        obs = pd.read_csv(f'{COMBO_DATA_DIR}/{name_ab}.clean.csv')
-        independent = pd.read_csv(f'{PFS_PRED_DIR}/{name_a}-{name_b}_combination_predicted_ind.csv')
+        obs = read_curve(COMBO_DATA_DIR, f'{name_ab}.clean')
+        independent = read_prediction(PFS_PRED_DIR, name_a, name_b, 'ind')
         # set tmax
         tmax = np.amin([obs['Time'].max(), independent['Time'].max()]) - 0.1
 
@@ -96,9 +103,8 @@ def plot_all_survival_qqplot() -> plt.figure:
         name_ab = tmp.at[i, 'Combination']
         add_color = pal[custom_dict[tmp.at[i, 'add_label']]]
         # import data
-        obs = pd.read_csv(f'{COMBO_DATA_DIR}/{name_ab}.clean.csv')
-        additive = pd.read_csv(
-            f'{PFS_PRED_DIR}/{name_a}-{name_b}_combination_predicted_add.csv')
+        obs = read_curve(COMBO_DATA_DIR, f'{name_ab}.clean')
+        additive = read_prediction(PFS_PRED_DIR, name_a, name_b, 'add')
         # set tmax
         tmax = np.amin([obs['Time'].max(), additive['Time'].max()]) - 0.1
 
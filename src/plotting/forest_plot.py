@@ -1,3 +1,8 @@
+import os
+import sys
+if __name__ == '__main__':
+    # run as a script from src/plotting: make the modules in src/ importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -5,7 +10,6 @@ import seaborn as sns
 import matplotlib.ticker as plticker
 from plot_utils import import_input_data_include_suppl
 import warnings
-import sys
 import yaml
 
 with open('config.yaml', 'r') as f:
@@ -1,3 +1,8 @@
+import os
+import sys
+if __name__ == '__main__':
+    # run as a script from src/plotting: make the modules in src/ importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
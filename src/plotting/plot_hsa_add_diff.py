@@ -3,7 +3,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.ticker as plticker
 import seaborn as sns
-from scipy.stats import linregress, pearsonr
+from scipy.stats import linregress
 from .plot_utils import get_model_colors
 import yaml
 
@@ -58,23 +58,6 @@ def reg_hsa_add_diff_vs_lognormal(lognorm_df, diff_df):
     return reg
 
 
-def corr_hsa_add_diff_vs_lognormal(lognorm_df, diff_df):
-    """Perform Pearson correlation between average standard deviation
-    of log-normal fit vs. HR(additivity vs. HSA).
-
-    Args:
-        lognorm_df (pd.DataFrame): log-normal parameters of combinations
-        diff_df (pd.DataFrame): HSA additivity difference
-
-    Returns:
-        LinregressResult: contains slope, intercept, rvalue, pvalue
-    """
-    avg_sigma = np.sqrt(
-        (lognorm_df['sigma_a']**2 + lognorm_df['sigma_b']**2)/2)
-    r, p = pearsonr(avg_sigma, np.log(diff_df['HR']))
-    return r, p
-
-
 def hsa_add_contribution_stacked_barplot():
     #FIXME This will probably break; need to change file paths
     diff_df = pd.read_csv('../analysis/additivity_HSA_similarity/difference.csv').round(5)
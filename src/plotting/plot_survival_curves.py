@@ -1,9 +1,15 @@
+import os
+import sys
+if __name__ == '__main__':
+    # run as a script from src/plotting: make the modules in src/ importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.ticker as plticker
 import seaborn as sns
 from plot_utils import import_input_data, get_model_colors
+from prediction_tensor import read_prediction
 import warnings
 import yaml
 
@@ -90,10 +96,8 @@ def plot_additive_survival() -> plt.figure:
         df_b = pd.read_csv(f'{COMBO_DATA_DIR}/{name_b}.clean.csv')
         df_ab = pd.read_csv(f'{COMBO_DATA_DIR}/{name_ab}.clean.csv')
 
-        independent = pd.read_csv(
-            f'{PFS_PRED_DIR}/{name_a}-{name_b}_combination_predicted_ind.csv')
-        additive = pd.read_csv(
-            f'{PFS_PRED_DIR}/{name_a}-{name_b}_combination_predicted_add.csv')
+        independent = read_prediction(PFS_PRED_DIR, name_a, name_b, 'ind')
+        additive = read_prediction(PFS_PRED_DIR, name_a, name_b, 'add')
 
         plot_survivals(df_b, df_ab, additive, independent, flat_axes[i])
         flat_axes[i].text(0.85, 0.8, str(
@@ -131,10 +135,8 @@ def plot_between_survival() -> plt.figure:
         df_b = pd.read_csv(f'{COMBO_DATA_DIR}/{name_b}.clean.csv')
         df_ab = pd.read_csv(f'{COMBO_DATA_DIR}/{name_ab}.clean.csv')
 
-        independent = pd.read_csv(
-            f'{PFS_PRED_DIR}/{name_a}-{name_b}_combination_predicted_ind.csv')
-        additive = pd.read_csv(
-            f'{PFS_PRED_DIR}/{name_a}-{name_b}_combination_predicted_add.csv')
+        independent = read_prediction(PFS_PRED_DIR, name_a, name_b, 'ind')
+        additive = read_prediction(PFS_PRED_DIR, name_a, name_b, 'add')
 
         plot_survivals(df_b, df_ab, additive, independent, flat_axes[i])
         flat_axes[i].text(0.85, 0.8, str(
@@ -170,10 +172,8 @@ def plot_hsa_survival() -> plt.figure:
         df_b = pd.read_csv(f'{COMBO_DATA_DIR}/{name_b}.clean.csv')
         df_ab = pd.read_csv(f'{COMBO_DATA_DIR}/{name_ab}.clean.csv')
 
-        independent = pd.read_csv(
-            f'{PFS_PRED_DIR}/{name_a}-{name_b}_combination_predicted_ind.csv')
-        additive = pd.read_csv(
-            f'{PFS_PRED_DIR}/{name_a}-{name_b}_combination_predicted_add.csv')
+        independent = read_prediction(PFS_PRED_DIR, name_a, name_b, 'ind')
+        additive = read_prediction(PFS_PRED_DIR, name_a, name_b, 'add')
 
         plot_survivals(df_b, df_ab, additive, independent, flat_axes[i])
         flat_axes[i].text(0.85, 0.8, str(
@@ -1,3 +1,8 @@
+import os
+import sys
+if __name__ == '__main__':
+    # run as a script from src/plotting: make the modules in src/ importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -5,10 +10,11 @@ import seaborn as sns
 import matplotlib.ticker as plticker
 import warnings
 import argparse
-import yaml
+from curve_store import read_curve
+from prediction_tensor import read_prediction
+from utils import load_config
 
-with open('config.yaml', 'r') as f:
-    CONFIG = yaml.safe_load(f)
+CONFIG = load_config()
 
 warnings.filterwarnings("ignore")
 plt.style.use('env/publication.mplstyle')
@@ -205,10 +211,9 @@ def plot_all_curves(sheet: pd.DataFrame, data_dir: str, pred_dir: str, waterfall
         label = tmp.at[i, 'label']
 
         # import data
-        obs_exp = pd.read_csv(f'{data_dir}/{name_a}.clean.csv')
-        obs_ctrl = pd.read_csv(f'{data_dir}/{name_b}.clean.csv')
-        independent = pd.read_csv(
-            f'{pred_dir}/{name_a}-{name_b}_combination_predicted_ind.csv')
+        obs_exp = read_curve(data_dir, f'{name_a}.clean')
+        obs_ctrl = read_curve(data_dir, f'{name_b}.clean')
+        independent = read_prediction(pred_dir, name_a, name_b, 'ind')
         if waterfall:
             flat_axes[i] = plot_waterfall_hsa_only(obs_ctrl, obs_exp, independent, ax=flat_axes[i], label=label)
         else:
@@ -217,11 +222,11 @@ def plot_all_curves(sheet: pd.DataFrame, data_dir: str, pred_dir: str, waterfall
     return fig
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('dataset', type=str,
                         help='Dataset to use (approved, all_phase3')
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     is_waterfall = (args.dataset == 'waterfall')
     config_dict = CONFIG[args.dataset]
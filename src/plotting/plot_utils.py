@@ -1,17 +1,19 @@
+from typing import TYPE_CHECKING
 import pandas as pd
 from scipy.interpolate import interp1d
-import yaml
-import matplotlib.ticker as plticker
-import matplotlib.pyplot as plt
+from utils import step_curve, load_config
 
-with open('config.yaml', 'r') as f:
-    CONFIG = yaml.safe_load(f)
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+
+CONFIG = load_config()
 
 COX_RESULT = CONFIG['approved']['cox_result']
 
 
 def interpolate(df, x='Time', y='Survival', kind='zero'):
-    """Wrapper function for scipy.interpolate.interp1d.
+    """Wrapper function for scipy.interpolate.interp1d. Step interpolation (kind='zero')
+    uses the cached utils.StepCurve instead.
 
     Args:
         df (pd.DataFrame): data to make interpolation.
@@ -21,8 +23,10 @@ def interpolate(df, x='Time', y='Survival', kind='zero'):
                               Feeds in to kind argument of interp1d function.. Defaults to 'zero'.
 
     Returns:
-        _type_: _description_
+        callable: x -> y interpolation function
     """    
+    if kind == 'zero':
+        return step_curve(df, x=x, y=y)
     return interp1d(df[x], df[y], kind=kind, fill_value='extrapolate')
 
 
@@ -91,7 +95,9 @@ def get_model_colors() -> dict:
     return color_dict
 
 
-def make_axes_logscale_for_HR(ax: plt.axes, x_major: list, y_major: list) -> plt.axes:
+def make_axes_logscale_for_HR(ax: 'plt.axes', x_major: list, y_major: list) -> 'plt.axes':
+    # matplotlib is imported here so that data helpers of this module stay light
+    import matplotlib.ticker as plticker
     ax.set_xscale('log', base=2)
     ax.set_yscale('log', base=2)
     ax.xaxis.set_major_locator(plticker.FixedLocator(x_major))
@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
+import os
+import sys
+if __name__ == '__main__':
+    # run as a script from src/plotting: make the modules in src/ importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.metrics import r2_score
 from plot_utils import import_input_data, set_figsize, interpolate
+from prediction_tensor import read_prediction
 import warnings
 from scipy.stats import pearsonr
 import yaml
@@ -41,8 +47,8 @@ def prepare_data_for_r2_histogram(cox_df: pd.DataFrame, data_dir: str, pred_dir:
 
         # import data
         obs = pd.read_csv(f'{data_dir}/{name_ab}.clean.csv')
-        independent = pd.read_csv(f'{pred_dir}/{name_a}-{name_b}_combination_predicted_ind.csv')
-        additive = pd.read_csv(f'{pred_dir}/{name_a}-{name_b}_combination_predicted_add.csv')
+        independent = read_prediction(pred_dir, name_a, name_b, 'ind')
+        additive = read_prediction(pred_dir, name_a, name_b, 'add')
 
         # set tmax
         tmax = np.amin([obs['Time'].max(), independent['Time'].max(),
@@ -94,8 +100,8 @@ def calc_total_R2(cox_df: pd.DataFrame, data_dir: str, pred_dir: str) -> tuple:
 
         # import data
         obs = pd.read_csv(f'{data_dir}/{name_ab}.clean.csv')
-        independent = pd.read_csv(f'{pred_dir}/{name_a}-{name_b}_combination_predicted_ind.csv')
-        additive = pd.read_csv(f'{pred_dir}/{name_a}-{name_b}_combination_predicted_add.csv')
+        independent = read_prediction(pred_dir, name_a, name_b, 'ind')
+        additive = read_prediction(pred_dir, name_a, name_b, 'add')
 
         # set tmax
         tmax = np.amin([obs['Time'].max(), independent['Time'].max(),
@@ -151,8 +157,8 @@ def prepare_data_for_r_histogram(cox_df: pd.DataFrame, data_dir: str, pred_dir:
 
         # import data
         obs = pd.read_csv(f'{data_dir}/{name_ab}.clean.csv')
-        independent = pd.read_csv(f'{pred_dir}/{name_a}-{name_b}_combination_predicted_ind.csv')
-        additive = pd.read_csv(f'{pred_dir}/{name_a}-{name_b}_combination_predicted_add.csv')
+        independent = read_prediction(pred_dir, name_a, name_b, 'ind')
+        additive = read_prediction(pred_dir, name_a, name_b, 'add')
 
         # set tmax
         tmax = np.amin([obs['Time'].max(), independent['Time'].max(),
@@ -244,10 +250,8 @@ def prepare_data_for_msd_histogram(cox_df: pd.DataFrame, data_dir: str, pred_dir
 
         # import data
         obs = pd.read_csv(f'{data_dir}/{name_ab}.clean.csv')
-        independent = pd.read_csv(
-            f'{pred_dir}/{name_a}-{name_b}_combination_predicted_ind.csv')
-        additive = pd.read_csv(
-            f'{pred_dir}/{name_a}-{name_b}_combination_predicted_add.csv')
+        independent = read_prediction(pred_dir, name_a, name_b, 'ind')
+        additive = read_prediction(pred_dir, name_a, name_b, 'add')
 
         # set tmax
         tmax = np.amin([obs['Time'].max(), independent['Time'].max(),
@@ -3,22 +3,30 @@ import numpy as np
 import argparse
 from scipy.stats import pearsonr
 from plotting.plot_utils import import_input_data
-from coxhazard_test import create_ipd, get_cox_results
-from plotting.plot_predict_success import plot_predict_success, plot_scatterplot_for_review
-import yaml
+from coxhazard_test import create_ipd, get_cox_results, get_test_results, TESTS
+from reconstruct_ipd import find_risk_table
+from curve_store import read_curve
+from prediction_tensor import read_prediction
+from utils import load_config
 
-with open('config.yaml', 'r') as f:
-    CONFIG = yaml.safe_load(f)
+CONFIG = load_config()
 
 
-def predict_success(input_df: pd.DataFrame, data_dir: str, pred_dir: str) -> pd.DataFrame:
+def predict_success(input_df: pd.DataFrame, data_dir: str, pred_dir: str, test='cox', raw_dir=None,
+                    agreement=False) -> pd.DataFrame:
     """Predict whether the trial would have been successful based
     on additivity and HSA predictions by Cox-PH test.
+    With test='logrank', success is decided by the log-rank test. With agreement=True,
+    Cox-PH success is also computed and kept alongside for comparison
+    (cox_success_ind, cox_success_add).
 
     Args:
         input_df (pd.DataFrame): _description_
         data_dir (str): directory path to observed survival data
         pred_dir (str): directory path to predicted survival data
+        test (str, optional): 'cox' or 'logrank'. Defaults to 'cox'.
+        raw_dir (str, optional): directory path to numbers-at-risk tables. Defaults to data_dir.
+        agreement (bool, optional): also run Cox with test='logrank'. Defaults to False.
 
     Returns:
         pd.DataFrame: predicted results
@@ -27,6 +35,8 @@ def predict_success(input_df: pd.DataFrame, data_dir: str, pred_dir: str) -> pd.
     results = pd.DataFrame(index=input_df.index,
                           columns=['p_ind', 'HR_ind', 'HRlower_ind', 'HRupper_ind',
                                    'p_add', 'HR_add', 'HRlower_add', 'HRupper_add'])
+    agreement = agreement and test != 'cox'
+    cox_p = pd.DataFrame(index=input_df.index, columns=['p_ind', 'p_add'])
     for i in range(input_df.shape[0]):
         name_a = input_df.at[i, 'Experimental']
         name_b = input_df.at[i, 'Control']
@@ -34,21 +44,20 @@ def predict_success(input_df: pd.DataFrame, data_dir: str, pred_dir: str) -> pd.
         n_control = input_df.at[i, 'N_control'].astype(int)
         n_combo = input_df.at[i, 'N_combination'].astype(int)
         # observed data
-        df_a = pd.read_csv(f'{data_dir}/{name_a}.clean.csv')
-        df_b = pd.read_csv(f'{data_dir}/{name_b}.clean.csv')
-        df_ab = pd.read_csv(f'{data_dir}/{name_ab}.clean.csv')
+        df_a = read_curve(data_dir, f'{name_a}.clean')
+        df_b = read_curve(data_dir, f'{name_b}.clean')
+        df_ab = read_curve(data_dir, f'{name_ab}.clean')
 
         try:
             ipd_control = pd.read_csv(f'{data_dir}/{name_b}_indiv.csv')
 
         except FileNotFoundError:
-            ipd_control = create_ipd(df_b, n=n_control)
+            ipd_control = create_ipd(df_b, n=n_control,
+                                     risk_table=find_risk_table(raw_dir or data_dir, name_ab, 'control'))
 
         # import prediction
-        independent = pd.read_csv(
-            f'{pred_dir}/{name_a}-{name_b}_combination_predicted_ind.csv')
-        additive = pd.read_csv(
-            f'{pred_dir}/{name_a}-{name_b}_combination_predicted_add.csv')
+        independent = read_prediction(pred_dir, name_a, name_b, 'ind')
+        additive = read_prediction(pred_dir, name_a, name_b, 'add')
 
         tmax = np.amin([df_ab['Time'].max(), independent['Time'].max(), 
                         df_a['Time'].max(), df_b['Time'].max()])
@@ -59,22 +68,33 @@ def predict_success(input_df: pd.DataFrame, data_dir: str, pred_dir: str) -> pd.
         ipd_ind = create_ipd(independent, n=n_combo)
 
         # additive
-        p, hr, lower, upper = get_cox_results(ipd_control, ipd_add)
+        p, hr, lower, upper = get_test_results(ipd_control, ipd_add, test=test)
         results.at[i, 'p_add'] = p
         results.at[i, 'HR_add'] = hr
         results.at[i, 'HRlower_add'] = lower
         results.at[i, 'HRupper_add'] = upper
 
         # independent
-        p, hr, lower, upper = get_cox_results(ipd_control, ipd_ind)
+        p, hr, lower, upper = get_test_results(ipd_control, ipd_ind, test=test)
         results.at[i, 'p_ind'] = p
         results.at[i, 'HR_ind'] = hr
         results.at[i, 'HRlower_ind'] = lower
         results.at[i, 'HRupper_ind'] = upper
+
+        if agreement:
+            cox_p.at[i, 'p_add'] = get_cox_results(ipd_control, ipd_add)[0]
+            cox_p.at[i, 'p_ind'] = get_cox_results(ipd_control, ipd_ind)[0]
     
     results.loc[:, 'success_ind'] = results['p_ind'] < 0.05
     results.loc[:, 'success_add'] = results['p_add'] < 0.05
 
+    if agreement:
+        results.loc[:, 'cox_success_ind'] = cox_p['p_ind'] < 0.05
+        results.loc[:, 'cox_success_add'] = cox_p['p_add'] < 0.05
+        agree = np.mean([results['success_ind'] == results['cox_success_ind'],
+                         results['success_add'] == results['cox_success_add']])
+        print(f"{test} agrees with Cox decision in {agree:.1%} of predictions")
+
     return pd.concat([input_df[['Experimental', 'Control', 'Combination', 'HR(combo/control)']], results], axis=1)
 
 
@@ -99,11 +119,15 @@ def calc_correlation(model, results):
         return
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('dataset', type=str, 
                         help='Dataset to use (approved, all_phase3, placebo, both')
-    args = parser.parse_args()
+    parser.add_argument('--test', type=str, default='cox', choices=TESTS,
+                        help='Test deciding trial success. logrank is a cheaper screening mode')
+    parser.add_argument('--agreement', action='store_true',
+                        help='With --test logrank, also run Cox and report decision agreement')
+    args = parser.parse_args(argv)
     
     if args.dataset == 'both':
         table_dir = CONFIG['table_dir']
@@ -114,11 +138,13 @@ def main():
             pred_dir = config_dict['pred_dir']
             if dataset == 'approved':
                 cox_df = import_input_data()
-                tmp1 = predict_success(cox_df, data_dir, pred_dir)
+                tmp1 = predict_success(cox_df, data_dir, pred_dir, test=args.test,
+                                       raw_dir=config_dict.get('raw_dir'), agreement=args.agreement)
                 tmp1.loc[:, "PFS_improvement"] = 1
             else:
                 cox_df = pd.read_csv(config_dict['cox_result'])
-                tmp2 = predict_success(cox_df, data_dir, pred_dir)
+                tmp2 = predict_success(cox_df, data_dir, pred_dir, test=args.test,
+                                       raw_dir=config_dict.get('raw_dir'), agreement=args.agreement)
                 tmp2.loc[:, "PFS_improvement"] = cox_df['PFS_improvement']
         results = pd.concat([tmp1, tmp2], axis=0).drop_duplicates(subset='Combination')
     
@@ -129,7 +155,8 @@ def main():
         pred_dir = config_dict['pred_dir']
         table_dir = config_dict['table_dir']
         fig_dir = config_dict['fig_dir']
-        results = predict_success(cox_df, data_dir, pred_dir)
+        results = predict_success(cox_df, data_dir, pred_dir, test=args.test,
+                                  raw_dir=config_dict.get('raw_dir'), agreement=args.agreement)
     else:
         config_dict = CONFIG[args.dataset]
         cox_df = pd.read_csv(config_dict['cox_result'])
@@ -137,8 +164,10 @@ def main():
         pred_dir = config_dict['pred_dir']
         table_dir = config_dict['table_dir']
         fig_dir = config_dict['fig_dir']
-        results = predict_success(cox_df, data_dir, pred_dir)
-    results.to_csv(f'{table_dir}/HR_predicted_vs_control.csv', index=False)
+        results = predict_success(cox_df, data_dir, pred_dir, test=args.test,
+                                  raw_dir=config_dict.get('raw_dir'), agreement=args.agreement)
+    suffix = '' if args.test == 'cox' else f'_{args.test}'
+    results.to_csv(f'{table_dir}/HR_predicted_vs_control{suffix}.csv', index=False)
     
     r_hsa, p_hsa = calc_correlation('HSA', results)
     r_add, p_add = calc_correlation('additivity', results)
@@ -146,8 +175,9 @@ def main():
     print("r_hsa={0:.02f}, p_hsa={1:.03f}, r_add={2:.05f}, p_add={3}".format(
         r_hsa, p_hsa, r_add, p_add))
     
+    from plotting.plot_predict_success import plot_scatterplot_for_review
     fig = plot_scatterplot_for_review(results)
-    fig.savefig(f'{fig_dir}/HR_combo_control_scatterplot.pdf',
+    fig.savefig(f'{fig_dir}/HR_combo_control_scatterplot{suffix}.pdf',
                 bbox_inches='tight', pad_inches=0.1)
 
 
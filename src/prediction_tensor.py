@@ -0,0 +1,154 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from curve_store import read_curve
+
+TENSOR_NAME = 'predictions.npy'
+SURVIVAL_NAME = 'predictions_survival.npy'
+INDEX_NAME = 'predictions.json'
+
+
+def combo_key(name_a: str, name_b: str) -> str:
+    return f'{name_a}-{name_b}'
+
+
+def write_prediction_tensor(pred_dir: str, combos: list, results: list, decimals=5):
+    """Write the predictions of a dataset as one dense (combo x model x N) tensor of
+    predicted times ({pred_dir}/predictions.npy), the (combo x N) survival grids
+    (predictions_survival.npy) and an index of combos and models (predictions.json).
+    Values are rounded like the csv exports so both give the same curves.
+
+    Args:
+        pred_dir (str): directory of prediction data
+        combos (list): combo keys ('{name_a}-{name_b}'), one per result
+        results (list): PredictionResult of each combo, all with the same models and N
+        decimals (int, optional): number of decimals to keep. Defaults to 5.
+    """
+    if not results:
+        raise ValueError(f'{pred_dir}: no predictions to write')
+    if len(combos) != len(results):
+        raise ValueError(f'{pred_dir}: {len(combos)} combos for {len(results)} predictions')
+    models = results[0].models
+    N = results[0].survival.shape[-1]
+    shape = (len(combos), len(models), N)
+    tmp_times = os.path.join(pred_dir, f'{TENSOR_NAME}.tmp')
+    tmp_survival = os.path.join(pred_dir, f'{SURVIVAL_NAME}.tmp')
+    times = np.lib.format.open_memmap(tmp_times, mode='w+', dtype=np.float64, shape=shape)
+    survival = np.lib.format.open_memmap(tmp_survival, mode='w+', dtype=np.float64, shape=shape[::2])
+    for c, result in enumerate(results):
+        if result.models != models or result.survival.shape[-1] != N:
+            raise ValueError(f'{combos[c]}: predictions must share models {models} and N={N}')
+        survival[c] = np.round(result.survival, decimals)
+        for m, model in enumerate(models):
+            times[c, m] = np.round(result[model], decimals)
+    times.flush()
+    survival.flush()
+    del times, survival
+    os.replace(tmp_times, os.path.join(pred_dir, TENSOR_NAME))
+    os.replace(tmp_survival, os.path.join(pred_dir, SURVIVAL_NAME))
+    # index is written last, readers only open tensors listed in a complete index
+    tmp_index = os.path.join(pred_dir, f'{INDEX_NAME}.tmp')
+    with open(tmp_index, 'w') as f:
+        json.dump({'combos': list(combos), 'models': list(models), 'N': int(N)}, f)
+    os.replace(tmp_index, os.path.join(pred_dir, INDEX_NAME))
+
+
+class PredictionTensor:
+    """Memory-mapped (read-only) prediction tensor of a prediction directory.
+    Arrays are views on the mapped files, so processes opening the same tensor
+    share its pages.
+
+    Args:
+        pred_dir (str): directory of prediction data
+    """
+
+    def __init__(self, pred_dir: str):
+        self.pred_dir = pred_dir
+        self.path = os.path.join(pred_dir, INDEX_NAME)
+        with open(self.path, 'r') as f:
+            index = json.load(f)
+        self.combos = {combo: c for c, combo in enumerate(index['combos'])}
+        self.models = {model: m for m, model in enumerate(index['models'])}
+        self.N = index['N']
+        self.times = np.load(os.path.join(pred_dir, TENSOR_NAME), mmap_mode='r')
+        self.survival = np.load(os.path.join(pred_dir, SURVIVAL_NAME), mmap_mode='r')
+
+    def __contains__(self, item):
+        combo, model = item
+        return combo in self.combos and model in self.models
+
+    def arrays(self, combo: str, model: str) -> tuple:
+        """Zero-copy (times, survival) views of one prediction."""
+        c = self.combos[combo]
+        return self.times[c, self.models[model]], self.survival[c]
+
+    def frame(self, combo: str, model: str) -> pd.DataFrame:
+        """One prediction as the Time/Survival DataFrame of its csv export (a copy)."""
+        times, survival = self.arrays(combo, model)
+        return pd.DataFrame({'Time': times, 'Survival': survival})
+
+
+_TENSORS = {}
+
+
+def open_predictions(pred_dir: str):
+    """PredictionTensor of a directory (None if it has none), reopened when the index changes."""
+    path = os.path.join(pred_dir, INDEX_NAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _TENSORS.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, PredictionTensor(pred_dir))
+        _TENSORS[path] = cached
+    return cached[1]
+
+
+def read_prediction_arrays(pred_dir: str, name_a: str, name_b: str, model: str) -> tuple:
+    """Read the {model} prediction of combination {name_a}-{name_b} as (times, survival)
+    arrays. From the directory's prediction tensor these are read-only views on the mapped
+    files (no copy); the csv (via read_curve) is used instead when the tensor does not hold
+    the prediction or the csv has been modified after the tensor was written.
+
+    Args:
+        pred_dir (str): directory of prediction data
+        name_a (str): treatment A name
+        name_b (str): treatment B name
+        model (str): model name (e.g. 'ind' or 'add')
+
+    Returns:
+        (np.ndarray, np.ndarray): predicted times and survival (%)
+    """
+    combo = combo_key(name_a, name_b)
+    name = f'{combo}_combination_predicted_{model}'
+    tensor = open_predictions(pred_dir)
+    if tensor is not None and (combo, model) in tensor:
+        try:
+            stale = (os.stat(os.path.join(pred_dir, f'{name}.csv')).st_mtime_ns
+                     > os.stat(tensor.path).st_mtime_ns)
+        except FileNotFoundError:
+            stale = False
+        if not stale:
+            return tensor.arrays(combo, model)
+    df = read_curve(pred_dir, name)
+    return df['Time'].to_numpy(), df['Survival'].to_numpy()
+
+
+def read_prediction(pred_dir: str, name_a: str, name_b: str, model: str) -> pd.DataFrame:
+    """Read the {model} prediction of combination {name_a}-{name_b} as a Time/Survival
+    DataFrame (see read_prediction_arrays). Building the DataFrame copies the mapped
+    arrays; use read_prediction_arrays to read them without a copy.
+
+    Args:
+        pred_dir (str): directory of prediction data
+        name_a (str): treatment A name
+        name_b (str): treatment B name
+        model (str): model name (e.g. 'ind' or 'add')
+
+    Returns:
+        pd.DataFrame: predicted survival data
+    """
+    times, survival = read_prediction_arrays(pred_dir, name_a, name_b, model)
+    return pd.DataFrame({'Time': times, 'Survival': survival})
@@ -1,116 +1,368 @@
 import numpy as np
 import pandas as pd
-import yaml
 import warnings
 import argparse
+import zlib
 from multiprocessing import Pool
-from coxhazard_test import get_cox_results, create_ipd
+from scipy.stats import norm, beta
+from coxhazard_test import get_cox_results, create_ipd, get_test_results, two_arm_test_batch, TESTS
+from reconstruct_ipd import find_risk_table
+from utils import SharedArrays, init_shared_arrays, shared_array, load_config
+from curve_store import read_curve
+from prediction_tensor import read_prediction
 warnings.filterwarnings("ignore")
 
-with open('config.yaml', 'r') as f:
-    CONFIG = yaml.safe_load(f)
+CONFIG = load_config()
 
 N = 5000
 NRUN = 1000
+N_COMBO = 500
+CHUNK = 100
 SEED = 0
-rng = np.random.default_rng(SEED)
+ARMS = ('Control', 'Experimental')
+INTERVALS = ('wilson', 'clopper-pearson')
 
 
 def simulate_one_trial(sampled_patients: np.array, ipd_ori: pd.DataFrame, ipd_control: pd.DataFrame) -> int:
     ipd_sim = ipd_ori.reindex(sampled_patients)
-    p, HR, low95, high95 = get_cox_results(ipd_control, ipd_sim)
+    p, HR, low95, high95 = get_cox_results(ipd_control, ipd_sim, use_cache=False)
     success = 0
     if p < 0.05 and high95 < 1:
         success = 1
     return success
 
 
-def calculate_success_prob(input_df: pd.DataFrame, i: int, data_dir: str, pred_dir: str) -> tuple:
-    """Calculate the probability of success for a given trial.
+def trial_decisions(sampled_patients: np.ndarray, ipd_ori: pd.DataFrame, ipd_control: pd.DataFrame,
+                    test='cox') -> np.ndarray:
+    """Success (p < 0.05 and upper 95% CI of HR < 1) of each simulated trial.
+    With test='cox', same decisions as calling simulate_one_trial on each row.
+
+    Args:
+        sampled_patients (np.ndarray): (NRUN, n_combo) indices into ipd_ori, one trial per row
+        ipd_ori (pd.DataFrame): IPD of the predicted combination
+        ipd_control (pd.DataFrame): IPD of the control arm
+        test (str, optional): 'cox' or 'logrank'. Defaults to 'cox'.
+
+    Returns:
+        np.ndarray: boolean success per trial
+    """
+    p, HR, low95, high95 = two_arm_test_batch(ipd_control['Time'].values, ipd_control['Event'].values,
+                                              ipd_ori['Time'].values, ipd_ori['Event'].values,
+                                              sampled_patients, test=test)
+    return (p < 0.05) & (high95 < 1)
+
+
+def simulate_trials(sampled_patients: np.ndarray, ipd_ori: pd.DataFrame, ipd_control: pd.DataFrame,
+                    test='cox') -> int:
+    """Number of successful simulated trials. See trial_decisions."""
+    return int(np.sum(trial_decisions(sampled_patients, ipd_ori, ipd_control, test=test)))
+
+
+def chunk_rng(dataset: str, i: int, arm: str, chunk: int) -> np.random.Generator:
+    """Random stream of one (dataset, combination, arm, run chunk) task.
+    Same as spawning children of SeedSequence(SEED) along dataset, combination,
+    arm, and chunk, so it does not depend on how tasks are scheduled.
+
+    Args:
+        dataset (str): dataset name
+        i (int): combination index
+        arm (str): 'Control' or 'Experimental'
+        chunk (int): chunk index of the NRUN simulated trials
+
+    Returns:
+        np.random.Generator: random number generator
+    """
+    key = (zlib.crc32(dataset.encode()), i, ARMS.index(arm), chunk)
+    return np.random.default_rng(np.random.SeedSequence(SEED, spawn_key=key))
+
+
+def load_trial_ipd(input_df: pd.DataFrame, i: int, data_dir: str, pred_dir: str, raw_dir=None) -> tuple:
+    """IPD of the predicted combination (N patients) and of each base arm of a trial.
 
     Args:
-        input_df (pd.DataFrame): _description_
-        i (int): _description_
-        data_dir (str): _description_
-        pred_dir (str): _description_
+        input_df (pd.DataFrame): metadata
+        i (int): combination index
+        data_dir (str): directory path to observed survival data
+        pred_dir (str): directory path to predicted survival data
+        raw_dir (str, optional): directory path to numbers-at-risk tables. Defaults to data_dir.
 
     Returns:
-        tuple: _description_
+        (pd.DataFrame, dict): IPD of HSA prediction, IPD of each arm in ARMS
     """
     name_a = input_df.at[i, 'Experimental']
     name_b = input_df.at[i, 'Control']
-
-    n_combo = 500
+    name_ab = input_df.at[i, 'Combination']
+    # numbers-at-risk table of each base arm: the control of the combination trial,
+    # and the treatment arm of the experimental drug's own trial
+    risk_tables = {'Control': (name_ab, 'control'), 'Experimental': (name_a, 'treatment')}
 
     # import prediction
-    independent = pd.read_csv(
-        f'{pred_dir}/{name_a}-{name_b}_combination_predicted_ind.csv')
+    independent = read_prediction(pred_dir, name_a, name_b, 'ind')
 
     independent = independent[independent['Time']
                               < independent['Time'].max() - 0.1]
     # make ipd using a large N and sample smaller number of patients later
     ipd_ind = create_ipd(independent, n=N)
-    
-    success_prob_ctrl = 0
-    success_prob_exp = 0
-    for arm in ['Control', 'Experimental']:
+
+    ipd_arms = {}
+    for arm in ARMS:
         name_base = input_df.at[i, arm]
         n_base = input_df.at[i, 'N_control'].astype(int)
         try:
             ipd_base = pd.read_csv(f'{data_dir}/{name_base}_indiv.csv')
 
         except FileNotFoundError:
-            df_base = pd.read_csv(f'{data_dir}/{name_base}.clean.csv')
-            ipd_base = create_ipd(df_base, n=n_base)
-        
-        # calculate probability of success using n_combo patients
-        success_cnt = 0
-        for run in range(NRUN):
-            sampled_patients = rng.integers(0, N, n_combo)
-            success_cnt += simulate_one_trial(sampled_patients, ipd_ind, ipd_base)
-        
-        # Cox-PH test usign large N
-        p, hr, lower, upper = get_cox_results(ipd_base, ipd_ind)
-
-        if arm == 'Control':
-            success_prob_ctrl = success_cnt / NRUN
-            p_ctrl, hr_ctrl, lower_ctrl, upper_ctrl = p, hr, lower, upper
-        else:
-            success_prob_exp = success_cnt / NRUN
-            p_exp, hr_exp, lower_exp, upper_exp = p, hr, lower, upper
-    
-    return i, success_prob_exp, success_prob_ctrl, p_ctrl, hr_ctrl, lower_ctrl, upper_ctrl, p_exp, hr_exp, lower_exp, upper_exp
+            df_base = read_curve(data_dir, f'{name_base}.clean')
+            ipd_base = create_ipd(df_base, n=n_base,
+                                  risk_table=find_risk_table(raw_dir or data_dir, *risk_tables[arm]))
+        ipd_arms[arm] = ipd_base
+    return ipd_ind, ipd_arms
+
+
+def simulate_chunk(dataset: str, i: int, arm: str, chunk: int, ipd_ind: pd.DataFrame, ipd_base: pd.DataFrame,
+                   test='cox', agreement=False, n_total=NRUN) -> tuple:
+    """Simulate one chunk of the NRUN trials of n_combo patients against one base arm.
+
+    Args:
+        dataset (str): dataset name
+        i (int): combination index
+        arm (str): 'Control' or 'Experimental'
+        chunk (int): chunk index
+        ipd_ind (pd.DataFrame): IPD of HSA prediction
+        ipd_base (pd.DataFrame): IPD of base arm
+        test (str, optional): 'cox' or 'logrank'. Defaults to 'cox'.
+        agreement (bool, optional): also run Cox on the same trials. Defaults to False.
+        n_total (int, optional): total number of trials the chunks are cut from. Defaults to NRUN.
+
+    Returns:
+        (int, int, int): number of successful trials, number of trials with the same decision as Cox,
+            number of trials
+    """
+    n_runs = min(CHUNK, n_total - chunk * CHUNK)
+    sampled_patients = chunk_rng(dataset, i, arm, chunk).integers(0, len(ipd_ind), (n_runs, N_COMBO))
+    decisions = trial_decisions(sampled_patients, ipd_ind, ipd_base, test=test)
+    n_agree = 0
+    if agreement and test != 'cox':
+        n_agree = int(np.sum(decisions == trial_decisions(sampled_patients, ipd_ind, ipd_base, test='cox')))
+    return int(decisions.sum()), n_agree, n_runs
+
+
+def success_interval(n_success: int, n_runs: int, method='wilson', alpha=0.05) -> tuple:
+    """Confidence interval of a success rate.
+
+    Args:
+        n_success (int): number of successes
+        n_runs (int): number of trials
+        method (str, optional): 'wilson' or 'clopper-pearson'. Defaults to 'wilson'.
+        alpha (float, optional): 1 - confidence level. Defaults to 0.05.
+
+    Returns:
+        (float, float): lower, upper bound
+    """
+    if method == 'wilson':
+        z = norm.ppf(1 - alpha / 2)
+        p = n_success / n_runs
+        center = (p + z**2 / (2 * n_runs)) / (1 + z**2 / n_runs)
+        half = z * np.sqrt(p * (1 - p) / n_runs + z**2 / (4 * n_runs**2)) / (1 + z**2 / n_runs)
+        return (center - half, center + half)
+    if method == 'clopper-pearson':
+        lower = beta.ppf(alpha / 2, n_success, n_runs - n_success + 1) if n_success > 0 else 0.
+        upper = beta.ppf(1 - alpha / 2, n_success + 1, n_runs - n_success) if n_success < n_runs else 1.
+        return (lower, upper)
+    raise ValueError(f"Unknown interval method '{method}'. Choose from {INTERVALS}")
 
 
-def predictive_power(metadata, data_dir, pred_dir):
+def simulate_arm(dataset: str, i: int, arm: str, ipd_ind: pd.DataFrame, ipd_base: pd.DataFrame,
+                 test='cox', agreement=False, width=None, max_runs=NRUN, interval='wilson') -> list:
+    """Simulate trials of one arm chunk by chunk. Without width, all max_runs trials are run.
+    With width, stop after the first chunk where the confidence interval of the
+    success rate is narrower than width, or when max_runs trials are reached.
+
+    Args:
+        dataset (str): dataset name
+        i (int): combination index
+        arm (str): 'Control' or 'Experimental'
+        ipd_ind (pd.DataFrame): IPD of HSA prediction
+        ipd_base (pd.DataFrame): IPD of base arm
+        test (str, optional): 'cox' or 'logrank'. Defaults to 'cox'.
+        agreement (bool, optional): also run Cox on the same trials. Defaults to False.
+        width (float, optional): target width of the interval. Defaults to None (no early stopping).
+        max_runs (int, optional): maximum number of trials. Defaults to NRUN.
+        interval (str, optional): 'wilson' or 'clopper-pearson'. Defaults to 'wilson'.
+
+    Returns:
+        list: simulate_chunk results of the chunks that were run
+    """
+    results = []
+    n_success = n_runs = 0
+    for chunk in range(-(-max_runs // CHUNK)):
+        res = simulate_chunk(dataset, i, arm, chunk, ipd_ind, ipd_base, test, agreement, n_total=max_runs)
+        results.append(res)
+        n_success += res[0]
+        n_runs += res[2]
+        if width is not None:
+            lower, upper = success_interval(n_success, n_runs, method=interval)
+            if upper - lower < width:
+                break
+    return results
+
+
+def _success_row(i: int, chunk_results: dict, full_results: dict, test: str, agreement: bool) -> tuple:
+    """Combine chunk results and large N test results of the two arms into one output row."""
+    n_runs = {arm: sum(res[2] for res in chunk_results[arm]) for arm in ARMS}
+    row = [i]
+    row += [sum(res[0] for res in chunk_results[arm]) / n_runs[arm] for arm in ('Experimental', 'Control')]
+    for arm in ARMS:
+        row += list(full_results[arm])
+    for arm in ARMS:
+        agree = np.nan
+        if agreement and test != 'cox':
+            agree = sum(res[1] for res in chunk_results[arm]) / n_runs[arm]
+        row.append(agree)
+    row += [n_runs[arm] for arm in ARMS]
+    return tuple(row)
+
+
+def calculate_success_prob(input_df: pd.DataFrame, i: int, data_dir: str, pred_dir: str, dataset: str,
+                           test='cox', agreement=False, width=None, max_runs=NRUN, interval='wilson',
+                           raw_dir=None) -> tuple:
+    """Calculate the probability of success for a given trial.
+    Sequential version of what predictive_power does for one row.
+
+    Args:
+        input_df (pd.DataFrame): metadata
+        i (int): combination index
+        data_dir (str): directory path to observed survival data
+        pred_dir (str): directory path to predicted survival data
+        dataset (str): dataset name (part of the random stream key)
+        test (str, optional): 'cox' or 'logrank'. Defaults to 'cox'.
+        agreement (bool, optional): also run Cox on the same simulated trials and
+            report the fraction of trials with the same decision. Defaults to False.
+        width (float, optional): stop simulating an arm once the confidence interval of its
+            success rate is narrower than width. Defaults to None (always max_runs trials).
+        max_runs (int, optional): maximum number of trials per arm. Defaults to NRUN.
+        interval (str, optional): 'wilson' or 'clopper-pearson'. Defaults to 'wilson'.
+        raw_dir (str, optional): directory path to numbers-at-risk tables. Defaults to data_dir.
+
+    Returns:
+        tuple: index, success probability (exp, ctrl), large N test results (ctrl, exp), 
+            agreement (ctrl, exp), number of trials (ctrl, exp)
+    """
+    ipd_ind, ipd_arms = load_trial_ipd(input_df, i, data_dir, pred_dir, raw_dir)
+    chunk_results = {arm: simulate_arm(dataset, i, arm, ipd_ind, ipd_arms[arm], test, agreement,
+                                       width, max_runs, interval) for arm in ARMS}
+    # Cox-PH (or log-rank) test usign large N
+    full_results = {arm: get_test_results(ipd_arms[arm], ipd_ind, test=test) for arm in ARMS}
+    return _success_row(i, chunk_results, full_results, test, agreement)
+
+
+def publish_trial_ipd(metadata: pd.DataFrame, data_dir: str, pred_dir: str, raw_dir=None) -> SharedArrays:
+    """Load the IPD of every combination once (load_trial_ipd) and publish it for pool workers
+    under keys (i, 'ind' or arm, 'Time' or 'Event').
+
+    Returns:
+        SharedArrays: published arrays (use init_shared_arrays as Pool initializer)
+    """
+    arrays = {}
+    for i in range(metadata.shape[0]):
+        ipd_ind, ipd_arms = load_trial_ipd(metadata, i, data_dir, pred_dir, raw_dir)
+        for key, ipd in [('ind', ipd_ind)] + list(ipd_arms.items()):
+            arrays[(i, key, 'Time')] = ipd['Time'].to_numpy()
+            arrays[(i, key, 'Event')] = ipd['Event'].to_numpy()
+    return SharedArrays(arrays)
+
+
+def _shared_ipd(i: int, key: str) -> pd.DataFrame:
+    return pd.DataFrame({'Time': shared_array((i, key, 'Time')), 'Event': shared_array((i, key, 'Event'))})
+
+
+def _shared_chunk(dataset, i, arm, chunk, test, agreement, n_total):
+    return simulate_chunk(dataset, i, arm, chunk, _shared_ipd(i, 'ind'), _shared_ipd(i, arm), 
+                          test, agreement, n_total)
+
+
+def _shared_arm(dataset, i, arm, test, agreement, width, max_runs, interval):
+    return simulate_arm(dataset, i, arm, _shared_ipd(i, 'ind'), _shared_ipd(i, arm),
+                        test, agreement, width, max_runs, interval)
+
+
+def _shared_test(i, arm, test):
+    return get_test_results(_shared_ipd(i, arm), _shared_ipd(i, 'ind'), test=test)
+
+
+def predictive_power(metadata, data_dir, pred_dir, dataset, test='cox', agreement=False, workers=4,
+                     width=None, max_runs=NRUN, interval='wilson', raw_dir=None):
+    """Probability of success of each combination, scheduled as (combination, arm, run chunk) tasks,
+    or as (combination, arm) tasks that stop early when width is given.
+    Every chunk has its own random stream, so the output does not depend on the number of workers.
+    """
     outdf = metadata.copy()
+    combos = range(metadata.shape[0])
+    n_chunk = -(-max_runs // CHUNK)
+    full_keys = [(i, arm) for i in combos for arm in ARMS]
+    shared = publish_trial_ipd(metadata, data_dir, pred_dir, raw_dir)
+    with shared, Pool(processes=workers, initializer=init_shared_arrays, initargs=(shared.spec,)) as pool:
+        if width is None:
+            keys = [(i, arm, c) for i in combos for arm in ARMS for c in range(n_chunk)]
+            args_list = [(dataset, i, arm, c, test, agreement, max_runs) for i, arm, c in keys]
+            chunk_list = pool.starmap(_shared_chunk, args_list, chunksize=1)
+            chunk_results = {key: [] for key in full_keys}
+            for (i, arm, c), res in zip(keys, chunk_list):
+                chunk_results[(i, arm)].append(res)
+        else:
+            args_list = [(dataset, i, arm, test, agreement, width, max_runs, interval) for i, arm in full_keys]
+            chunk_results = dict(zip(full_keys, pool.starmap(_shared_arm, args_list, chunksize=1)))
+        full_list = pool.starmap(_shared_test, [(i, arm, test) for i, arm in full_keys])
+
+    full_results = dict(zip(full_keys, full_list))
     ll = []
-    with Pool(processes=4) as pool:
-        args_list = [(metadata, i, data_dir, pred_dir) for i in range(metadata.shape[0])]
-        for result in pool.starmap(calculate_success_prob, args_list):
-            print(result)
-            ll.append(result)
+    for i in combos:
+        result = _success_row(i, {arm: chunk_results[(i, arm)] for arm in ARMS},
+                              {arm: full_results[(i, arm)] for arm in ARMS}, test, agreement)
+        print(result)
+        ll.append(result)
     tmp = pd.DataFrame(ll, columns=['idx','prob_success_exp', 'prob_success_ctrl', 
                                     'p_ctrl', 'hr_ctrl', 'lower_ctrl', 'upper_ctrl',
-                                    'p_exp', 'hr_exp', 'lower_exp', 'upper_exp'])
+                                    'p_exp', 'hr_exp', 'lower_exp', 'upper_exp',
+                                    'agree_ctrl', 'agree_exp', 'nrun_ctrl', 'nrun_exp'])
     tmp = tmp.set_index('idx', drop=True)
+    if agreement and test != 'cox':
+        print(f"{test} agrees with Cox decision in {tmp[['agree_ctrl', 'agree_exp']].mean().mean():.1%} of simulated trials")
+    else:
+        tmp = tmp.drop(columns=['agree_ctrl', 'agree_exp'])
     outdf = pd.concat([outdf, tmp], axis=1)
     return outdf
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('dataset', type=str, 
                         help='Dataset to use (PFS, rPFS, waterfall)')
-    args = parser.parse_args()
+    parser.add_argument('--test', type=str, default='cox', choices=TESTS,
+                        help='Test deciding trial success. logrank is a cheaper screening mode')
+    parser.add_argument('--agreement', action='store_true',
+                        help='With --test logrank, also run Cox and report decision agreement')
+    parser.add_argument('--workers', type=int, default=CONFIG.get('workers', 4),
+                        help='Number of worker processes (default: workers in config.yaml, or 4)')
+    parser.add_argument('--width', type=float, default=None,
+                        help='Stop simulating an arm once the CI of its success rate is narrower than this')
+    parser.add_argument('--max-runs', type=int, default=NRUN,
+                        help=f'Maximum number of simulated trials per arm (default: {NRUN})')
+    parser.add_argument('--interval', type=str, default='wilson', choices=INTERVALS,
+                        help='Confidence interval used with --width')
+    args = parser.parse_args(argv)
     config_dict = CONFIG[args.dataset]
     metadata = pd.read_csv(config_dict['metadata_sheet_seed'], sep='\t')
     data_dir = config_dict['data_dir']
     pred_dir = config_dict['pred_dir']
     table_dir = config_dict['table_dir']
 
-    outdf = predictive_power(metadata, data_dir, pred_dir)
-    outdf.to_csv(f'{table_dir}/{args.dataset}_predictive_power.csv', index=False)
+    outdf = predictive_power(metadata, data_dir, pred_dir, args.dataset, 
+                             test=args.test, agreement=args.agreement, workers=args.workers,
+                             width=args.width, max_runs=args.max_runs, interval=args.interval,
+                             raw_dir=config_dict.get('raw_dir'))
+    suffix = '' if args.test == 'cox' else f'_{args.test}'
+    outdf.to_csv(f'{table_dir}/{args.dataset}_predictive_power{suffix}.csv', index=False)
 
 
 if __name__ == '__main__':
@@ -4,10 +4,9 @@ import matplotlib.pyplot as plt
 import os
 from pathlib import Path
 import argparse
-import yaml
+from utils import load_config
 
-with open('config.yaml', 'r') as f:
-    CONFIG = yaml.safe_load(f)
+CONFIG = load_config()
 
 
 def raw_import(filepath: str) -> pd.DataFrame:
@@ -208,11 +207,15 @@ def stand_alone():
         cleaned.to_csv(args.output, index=False)
 
 
-if __name__ == '__main__':
+def main(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('dataset', type=str, 
                         help='Dataset to use (PFS, rPFS, waterfall')
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     preprocess_combinations(args.dataset)
     sanity_check_everything(args.dataset)
+
+
+if __name__ == '__main__':
+    main()
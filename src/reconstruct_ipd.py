@@ -0,0 +1,320 @@
+"""Reconstruction of individual patient data (IPD) from a digitized Kaplan-Meier curve
+and its numbers-at-risk table (Guyot et al. 2012, BMC Med Res Methodol).
+NumPy port of extract_IPD/IPD_Functions.R (DIGI.CLEANUP, K.COORDINATES, GENERATEINDIVIDUALDATA)."""
+import os
+import numpy as np
+import pandas as pd
+from curve_store import read_curve
+
+
+def _signif(x: np.ndarray, digits=3) -> np.ndarray:
+    """Round to significant digits (R signif)."""
+    x = np.asarray(x, dtype=np.float64)
+    out = x.copy()
+    nonzero = (x != 0) & np.isfinite(x)
+    scale = 10.0 ** (digits - 1 - np.floor(np.log10(np.abs(x[nonzero]))))
+    out[nonzero] = np.round(x[nonzero] * scale) / scale
+    return out
+
+
+def _antitonic(y: np.ndarray, w: np.ndarray) -> np.ndarray:
+    """Weighted non-increasing least squares fit by pool adjacent violators (fdrtool monoreg, type='a')."""
+    values, weights, counts = [], [], []
+    for yi, wi in zip(y, w):
+        values.append(yi)
+        weights.append(wi)
+        counts.append(1)
+        while len(values) > 1 and values[-2] < values[-1]:
+            wsum = weights[-2] + weights[-1]
+            values[-2] = (values[-2] * weights[-2] + values[-1] * weights[-1]) / wsum
+            weights[-2] = wsum
+            counts[-2] += counts[-1]
+            del values[-1], weights[-1], counts[-1]
+    return np.repeat(values, counts)
+
+
+def digi_cleanup(time: np.ndarray, survival: np.ndarray) -> tuple:
+    """Clean a digitized curve: add (0, 1), round to 3 significant digits, sort,
+    and make survival non-increasing. Survival in percent is rescaled to 0-1.
+
+    Args:
+        time (np.ndarray): digitized times
+        survival (np.ndarray): digitized survival (0-1 or 0-100)
+
+    Returns:
+        (np.ndarray, np.ndarray): distinct increasing times and non-increasing survival
+    """
+    time = np.asarray(time, dtype=np.float64)
+    survival = np.asarray(survival, dtype=np.float64)
+    keep = ~(np.isnan(time) | np.isnan(survival))
+    time, survival = time[keep], survival[keep]
+    if survival.max() > 2:
+        survival = survival / 100
+    time = _signif(np.append(time, 0))
+    survival = _signif(np.minimum(np.append(survival, 1), 1))
+    points = np.unique(np.column_stack((time, -survival)), axis=0)
+    time, survival = points[:, 0], -points[:, 1]
+    # tied times are pooled with their mean before the monotone fit
+    uniq, inv, cnt = np.unique(time, return_inverse=True, return_counts=True)
+    mean_surv = np.bincount(inv, weights=survival) / cnt
+    return uniq, _antitonic(mean_surv, cnt.astype(np.float64))
+
+
+def k_coordinates(t_risk: np.ndarray, t_s: np.ndarray) -> tuple:
+    """Indices of the curve points spanned by each at-risk interval.
+
+    Args:
+        t_risk (np.ndarray): times of the numbers-at-risk table
+        t_s (np.ndarray): increasing times of the cleaned curve
+
+    Returns:
+        (np.ndarray, np.ndarray): first and last curve index of each interval
+    """
+    lower = np.searchsorted(t_s, t_risk, side='left')
+    lower[lower >= len(t_s)] = len(t_s) - 1
+    upper = np.append(lower[1:] - 1, lower[-1])
+    return lower, upper
+
+
+def _censor_counts(n_censor: int, t_from: float, t_to: float, breaks: np.ndarray) -> np.ndarray:
+    """Spread n_censor censorings evenly on (t_from, t_to) and count them
+    on the right-closed intervals between breaks (R hist)."""
+    n_bins = len(breaks) - 1
+    if n_bins <= 0:
+        return np.zeros(0)
+    cen_t = t_from + np.arange(1, n_censor + 1) * (t_to - t_from) / (n_censor + 1)
+    bins = np.clip(np.searchsorted(breaks, cen_t, side='left') - 1, 0, n_bins - 1)
+    return np.bincount(bins, minlength=n_bins).astype(np.float64)
+
+
+def generate_ipd(t_s: np.ndarray, s: np.ndarray, t_risk: np.ndarray, n_risk: np.ndarray,
+                 tot_events=None, max_iter=1000) -> tuple:
+    """Reconstruct IPD of one arm (GENERATEINDIVIDUALDATA).
+
+    Args:
+        t_s (np.ndarray): increasing times of the cleaned curve (starting at 0)
+        s (np.ndarray): non-increasing survival (0-1) of the cleaned curve
+        t_risk (np.ndarray): times of the numbers-at-risk table (starting at 0)
+        n_risk (np.ndarray): numbers at risk
+        tot_events (int, optional): total number of events if reported. Defaults to None.
+        max_iter (int, optional): cap on the censoring adjustment iterations. Defaults to 1000.
+
+    Returns:
+        (np.ndarray, np.ndarray): times (float64) and events (int8)
+    """
+    t_s = np.asarray(t_s, dtype=np.float64)
+    s = np.asarray(s, dtype=np.float64)
+    n_risk = np.asarray(n_risk, dtype=np.float64).copy()
+    lower, upper = k_coordinates(np.asarray(t_risk, dtype=np.float64), t_s)
+    n_int = len(n_risk)
+    n_t = upper[-1]
+    n_patients = int(n_risk[0])
+
+    n_censor = np.zeros(n_int)
+    n_hat = np.full(n_t + 2, n_risk[0] + 1)
+    cen = np.zeros(n_t + 1)
+    d = np.zeros(n_t + 1)
+    km_hat = np.ones(n_t + 1)
+    last_i = np.zeros(n_int, dtype=int)
+    last = 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # time intervals 1, ..., n_int - 1
+        for i in range(n_int - 1):
+            lo, up, lo_next = lower[i], upper[i], lower[i + 1]
+            # first approximation of the number censored on interval i
+            n_censor[i] = np.round(n_risk[i] * s[lo_next] / s[lo] - n_risk[i + 1])
+            n_iter = 0
+            # adjust censoring until n_hat = n_risk at the start of interval i + 1
+            while ((n_hat[lo_next] > n_risk[i + 1]) or
+                   ((n_hat[lo_next] < n_risk[i + 1]) and (n_censor[i] > 0))) and n_iter < max_iter:
+                n_iter += 1
+                if n_censor[i] <= 0:
+                    cen[lo:up + 1] = 0
+                    n_censor[i] = 0
+                if n_censor[i] > 0:
+                    cen[lo:up + 1] = _censor_counts(int(n_censor[i]), t_s[lo], t_s[lo_next],
+                                                    t_s[lo:lo_next + 1])
+                # events and numbers at risk that agree with the K-M curve
+                n_hat[lo] = n_risk[i]
+                last = last_i[i]
+                for k in range(lo, up + 1):
+                    if i == 0 and k == lo:
+                        d[k] = 0
+                        km_hat[k] = 1
+                    else:
+                        d[k] = np.round(n_hat[k] * (1 - s[k] / km_hat[last]))
+                        km_hat[k] = km_hat[last] * (1 - d[k] / n_hat[k])
+                    n_hat[k + 1] = n_hat[k] - d[k] - cen[k]
+                    if d[k] != 0:
+                        last = k
+                n_censor[i] += n_hat[lo_next] - n_risk[i + 1]
+            if n_hat[lo_next] < n_risk[i + 1]:
+                n_risk[i + 1] = n_hat[lo_next]
+            last_i[i + 1] = last
+
+        # last time interval: same censoring rate as the average over previous intervals
+        j = n_int - 1
+        lo, up = lower[j], upper[j]
+        if n_int > 1:
+            n_censor[j] = min(np.round(n_censor[:j].sum() * (t_s[up] - t_s[lo]) /
+                                       (t_s[upper[j - 1]] - t_s[lower[0]])), n_risk[j])
+
+        def last_interval(first_pass=True):
+            if n_censor[j] <= 0:
+                cen[lo:up] = 0
+                n_censor[j] = 0
+            if n_censor[j] > 0:
+                cen[lo:up] = _censor_counts(int(n_censor[j]), t_s[lo], t_s[up], t_s[lo:up + 1])
+            n_hat[lo] = n_risk[j]
+            last = last_i[j]
+            for k in range(lo, up + 1):
+                if first_pass:
+                    d[k] = np.round(n_hat[k] * (1 - s[k] / km_hat[last])) if km_hat[last] != 0 else 0
+                else:
+                    d[k] = np.round(n_hat[k] * (1 - s[k] / km_hat[last]))
+                km_hat[k] = km_hat[last] * (1 - d[k] / n_hat[k])
+                if first_pass or k != up:
+                    n_hat[k + 1] = n_hat[k] - d[k] - cen[k]
+                    # number at risk cannot be negative
+                    if n_hat[k + 1] < 0:
+                        n_hat[k + 1] = 0
+                        cen[k] = n_hat[k] - d[k]
+                if d[k] != 0:
+                    last = k
+
+        last_interval()
+        # if the total number of events is reported, adjust censoring to agree with it
+        if tot_events is not None:
+            sum_d_prev = 0
+            if n_int > 1:
+                sum_d_prev = d[:upper[j - 1] + 1].sum()
+                # too many events already: no events or censoring on the last interval
+                if sum_d_prev >= tot_events:
+                    d[lo:up + 1] = 0
+                    if up > lo:
+                        cen[lo:up] = 0
+                    n_hat[lo + 1:up + 2] = n_risk[j]
+            if sum_d_prev < tot_events or n_int == 1:
+                sum_d = d[:up + 1].sum()
+                n_iter = 0
+                while ((sum_d > tot_events) or ((sum_d < tot_events) and (n_censor[j] > 0))) and n_iter < max_iter:
+                    n_iter += 1
+                    n_censor[j] += sum_d - tot_events
+                    last_interval(first_pass=False)
+                    sum_d = d[:up + 1].sum()
+
+    # form IPD: events, then censorings at interval midpoints, then the rest censored at the end
+    d = np.nan_to_num(d[:n_t + 1]).astype(int).clip(min=0)
+    cen = np.nan_to_num(cen[:n_t]).astype(int).clip(min=0)
+    event_t = np.repeat(t_s[:n_t + 1], d)
+    cen_t = np.repeat((t_s[:n_t] + t_s[1:n_t + 1]) / 2, cen)
+    n_rest = max(n_patients - len(event_t) - len(cen_t), 0)
+    times = np.concatenate((event_t, cen_t, np.full(n_rest, t_s[n_t])))
+    events = np.concatenate((np.ones(len(event_t), dtype=np.int8),
+                             np.zeros(len(cen_t) + n_rest, dtype=np.int8)))
+    return times, events
+
+
+def reconstruct_ipd(df: pd.DataFrame, risk_table=None, n=500, tot_events=None) -> tuple:
+    """Reconstruct IPD of one arm from its survival curve and numbers-at-risk table.
+    With a table, the IPD has the patients of the table (about its number at risk at time 0).
+    Without a table, the arm is taken as n patients at risk at time 0 with no
+    censoring before the end of the curve (where the remaining patients are censored),
+    and exactly n patients are returned.
+
+    Args:
+        df (pd.DataFrame): survival data points (Time, Survival)
+        risk_table (pd.DataFrame, optional): numbers at risk with columns time, nrisk. Defaults to None.
+        n (int, optional): number of patients when risk_table is None. Defaults to 500.
+        tot_events (int, optional): total number of events if reported. Defaults to None.
+
+    Returns:
+        (np.ndarray, np.ndarray): times (float64) and events (int8)
+    """
+    t_s, s = digi_cleanup(df['Time'].values, df['Survival'].values)
+    if risk_table is None:
+        # the last row of a table only spans one curve point, so close the table at the end of the curve
+        t_risk, n_risk = np.array([0., t_s[-1]]), np.array([n, np.round(n * s[-1])])
+        times, events = generate_ipd(t_s, s, t_risk, n_risk, tot_events=tot_events)
+        return _fit_size(times, events, n)
+    t_risk, n_risk = risk_table['time'].values, risk_table['nrisk'].values
+    return generate_ipd(t_s, s, t_risk, n_risk, tot_events=tot_events)
+
+
+def _fit_size(times: np.ndarray, events: np.ndarray, n: int) -> tuple:
+    """Drop the records rounding added beyond n patients (latest censorings first, then latest events)."""
+    excess = len(times) - n
+    if excess <= 0:
+        return times, events
+    # censored before events, latest first
+    order = np.lexsort((-times, events))
+    keep = np.sort(order[excess:])
+    return times[keep], events[keep]
+
+
+def reconstruct_ipd_batch(dfs: list, risk_tables=None, n=500, tot_events=None) -> list:
+    """Reconstruct IPD of many arms.
+
+    Args:
+        dfs (list): survival data points of each arm
+        risk_tables (list, optional): numbers-at-risk table (or None) of each arm. Defaults to None.
+        n (int, optional): number of patients of arms without a table. Defaults to 500.
+        tot_events (list, optional): total number of events (or None) of each arm. Defaults to None.
+
+    Returns:
+        list: (times, events) of each arm
+    """
+    if risk_tables is None:
+        risk_tables = [None] * len(dfs)
+    if tot_events is None:
+        tot_events = [None] * len(dfs)
+    return [reconstruct_ipd(df, table, n=n, tot_events=te)
+            for df, table, te in zip(dfs, risk_tables, tot_events)]
+
+
+def read_risk_table(path: str, arm: str) -> pd.DataFrame:
+    """Numbers-at-risk table of one arm from an at-risk csv (columns time, control, treatment).
+
+    Args:
+        path (str): path to the at-risk csv
+        arm (str): 'control' or 'treatment'
+
+    Returns:
+        pd.DataFrame: columns time, nrisk
+    """
+    df = read_curve(os.path.dirname(path), os.path.basename(path)[:-len('.csv')])
+    return pd.DataFrame({'time': df['time'], 'nrisk': df[arm]})
+
+
+def risk_table_file(directory: str, name: str):
+    """Path of the at-risk csv of the trial of a treatment arm, named as in
+    extract_IPD/Implementation_hh_cmd.R: {cancer}_{test drug}_{trial}_{endpoint}_at-risk.csv,
+    where the test drug is the first drug of the arm
+    (e.g. Prostate_Olaparib-Abiraterone_Clarke2018_rPFS -> Prostate_Olaparib_Clarke2018_rPFS_at-risk.csv).
+    None if the name does not follow the {cancer}_{drugs}_{trial}_{endpoint} layout.
+    """
+    tokens = name.split('_')
+    if len(tokens) < 4:
+        return None
+    test_drug = tokens[1].split('-')[0]
+    return os.path.join(directory, '_'.join([tokens[0], test_drug, tokens[2], tokens[3], 'at-risk']) + '.csv')
+
+
+def find_risk_table(directory: str, name: str, arm='treatment'):
+    """Numbers-at-risk table of one arm of a trial, or None when the trial has no at-risk csv.
+    The control arm of a trial is found through its treatment arm, e.g. the control of a
+    combination trial is find_risk_table(directory, combination, 'control').
+
+    Args:
+        directory (str): directory of the at-risk csv files
+        name (str): treatment arm of the trial
+        arm (str, optional): 'control' or 'treatment'. Defaults to 'treatment'.
+
+    Returns:
+        pd.DataFrame: columns time, nrisk (or None)
+    """
+    path = risk_table_file(directory, name)
+    if path is None or not os.path.exists(path):
+        return None
+    return read_risk_table(path, arm)
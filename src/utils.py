@@ -1,12 +1,382 @@
 import pandas as pd
 import numpy as np
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import threading
+import yaml
+from collections import OrderedDict
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
 from scipy.interpolate import interp1d
-from scipy.stats import spearmanr
+from scipy.stats import norm
+
+CORRELATION_METHODS = ('recursive', 'iman_conover')
+
+_CONFIGS = {}
+
+
+def load_config(path='config.yaml') -> dict:
+    """Parsed config file, read once per process and re-read only when the file changes.
+    All callers share the returned dict, so it must not be modified.
+
+    Args:
+        path (str, optional): path to the yaml file. Defaults to 'config.yaml'.
+
+    Returns:
+        dict: configuration
+    """
+    mtime = os.stat(path).st_mtime_ns
+    key = os.path.abspath(path)
+    cached = _CONFIGS.get(key)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'r') as f:
+            cached = (mtime, yaml.safe_load(f))
+        _CONFIGS[key] = cached
+    return cached[1]
+
 
 def interpolate(df, x='Time', y='Survival', kind='zero'):
+    if kind == 'zero':
+        return step_curve(df, x=x, y=y)
     return interp1d(df[x], df[y], kind=kind, fill_value='extrapolate')
 
 
+class LRUCache:
+    """Least-recently-used mapping with a bounded number of entries.
+    Safe to share between threads (e.g. the thread executor of coxhazard_test).
+
+    Args:
+        maxsize (int): maximum number of entries. Defaults to 128.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskCache:
+    """Persistent least-recently-used mapping of string keys to JSON values in a
+    sqlite database. Each process keeps one connection (reopened after a fork), shared by
+    its threads under a lock; sqlite serializes concurrent writers of different processes.
+    Reads do not write: the last-use times of hits are kept in memory and written in one
+    batch with the next put or every touch_every hits, so eviction order is approximate.
+    Entries beyond maxsize are evicted in one pass once the table has grown by
+    about 10% past maxsize.
+
+    Args:
+        path (str): path to the sqlite file (created if missing)
+        maxsize (int): maximum number of entries. Defaults to 100000.
+        touch_every (int): number of hits whose last-use times are buffered. Defaults to 1000.
+    """
+
+    def __init__(self, path, maxsize=100000, touch_every=1000):
+        self.path = path
+        self.maxsize = maxsize
+        self.touch_every = touch_every
+        self._margin = max(1, maxsize // 10)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS cache '
+                             '(key TEXT PRIMARY KEY, value TEXT, last_used REAL)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_last_used ON cache (last_used)')
+
+    def _connection(self):
+        if self._pid != os.getpid():
+            if self._conn is not None:
+                # never close a connection inherited through fork, it belongs to the parent
+                _FORKED_CONNECTIONS.append(self._conn)
+            self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._pid = os.getpid()
+            self._touched = {}
+            # number of entries, counted at the first put of this process
+            self._size = None
+        return self._conn
+
+    def _write_touched(self, conn):
+        if self._touched:
+            conn.executemany('UPDATE cache SET last_used = ? WHERE key = ?',
+                             [(t, key) for key, t in self._touched.items()])
+            self._touched = {}
+
+    def get(self, key, default=None):
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return default
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.touch_every:
+                with conn:
+                    self._write_touched(conn)
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)', 
+                             (key, json.dumps(value), time.time()))
+                self._write_touched(conn)
+            if self._size is None:
+                self._size = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            else:
+                self._size += 1
+            if self._size > self.maxsize + self._margin:
+                with conn:
+                    n_extra = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.maxsize
+                    if n_extra > 0:
+                        conn.execute('DELETE FROM cache WHERE key IN '
+                                     '(SELECT key FROM cache ORDER BY last_used LIMIT ?)', (n_extra,))
+                self._size = min(self._size, self.maxsize)
+
+    def flush(self):
+        """Write buffered last-use times."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                self._write_touched(conn)
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('DELETE FROM cache')
+            self._touched = {}
+            self._size = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+_FORKED_CONNECTIONS = []
+
+
+class SharedArrays:
+    """Named arrays published once for the workers of a multiprocessing pool.
+    The arrays are copied into one multiprocessing.shared_memory block and workers
+    attach to it with init_shared_arrays (pass as Pool initializer with initargs=(spec,)),
+    so tasks only need to send keys. Without shared_memory (Python < 3.8),
+    spec carries the arrays and each worker receives them once at start.
+
+    Args:
+        arrays (dict): key -> np.ndarray
+    """
+
+    def __init__(self, arrays: dict):
+        arrays = {key: np.ascontiguousarray(arr) for key, arr in arrays.items()}
+        self._shm = None
+        if shared_memory is None:
+            self.spec = (None, arrays)
+            return
+        layout = {}
+        offset = 0
+        for key, arr in arrays.items():
+            layout[key] = (offset, arr.shape, arr.dtype.str)
+            offset += -(-arr.nbytes // 8) * 8  # keep 8-byte alignment
+        self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for key, arr in arrays.items():
+            start = layout[key][0]
+            self._shm.buf[start:start + arr.nbytes] = arr.tobytes()
+        self.spec = (self._shm.name, layout)
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_SHARED = {'shm': None, 'arrays': {}}
+
+
+def init_shared_arrays(spec):
+    """Pool initializer: attach to the arrays published by SharedArrays."""
+    name, layout = spec
+    if name is None:
+        arrays = layout
+    else:
+        shm = shared_memory.SharedMemory(name=name)
+        _SHARED['shm'] = shm  # keep the mapping alive in this worker
+        arrays = {key: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+                  for key, (offset, shape, dtype) in layout.items()}
+    for arr in arrays.values():
+        arr.setflags(write=False)
+    _SHARED['arrays'] = arrays
+
+
+def shared_array(key) -> np.ndarray:
+    """Read-only array published under key (inside a worker started with init_shared_arrays)."""
+    return _SHARED['arrays'][key]
+
+
+def curve_hash(*arrays) -> str:
+    """Content hash of one or more numeric arrays (e.g. Time and Survival columns).
+
+    Returns:
+        str: hex digest
+    """
+    h = hashlib.sha1()
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr, dtype=np.float64)
+        h.update(str(arr.shape).encode())
+        h.update(arr.tobytes())
+    return h.hexdigest()
+
+
+def _readonly(*arrays) -> tuple:
+    for arr in arrays:
+        arr.setflags(write=False)
+    return arrays
+
+
+class StepCurve:
+    """Zero-order (step) interpolation of a curve evaluated with np.searchsorted.
+    The knots are sorted once; evaluation is equivalent to
+    interp1d(x, y, kind='zero', fill_value='extrapolate').
+
+    Args:
+        x (array_like): x values of the knots (e.g. Time)
+        y (array_like): y values of the knots (e.g. Survival)
+    """
+
+    def __init__(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        order = np.argsort(x, kind='mergesort')
+        self.x, self.y = _readonly(x[order], y[order])
+        self._inverse = None
+
+    def __call__(self, points):
+        """Evaluate y at points (forward, e.g. time -> survival)."""
+        idx = np.searchsorted(self.x, points, side='right') - 1
+        idx = np.clip(idx, 0, len(self.x) - 1)
+        return np.asarray(self.y[idx])
+
+    def inverse(self, points):
+        """Evaluate x at points of y (inverse, e.g. survival -> time)."""
+        if self._inverse is None:
+            self._inverse = StepCurve(self.y, self.x)
+        return self._inverse(points)
+
+
+_STEP_CURVE_CACHE = LRUCache(maxsize=512)
+
+
+def step_curve(df: pd.DataFrame, x='Time', y='Survival') -> StepCurve:
+    """StepCurve of two columns of a survival dataframe, cached by curve content.
+
+    Args:
+        df (pd.DataFrame): survival data
+        x (str, optional): column name to use as x values. Defaults to 'Time'.
+        y (str, optional): column name to use as y values. Defaults to 'Survival'.
+
+    Returns:
+        StepCurve: x -> y step function (use .inverse for y -> x)
+    """
+    x_arr = df[x].to_numpy(dtype=np.float64)
+    y_arr = df[y].to_numpy(dtype=np.float64)
+    key = curve_hash(x_arr, y_arr)
+    curve = _STEP_CURVE_CACHE.get(key)
+    if curve is None:
+        curve = StepCurve(x_arr, y_arr)
+        _STEP_CURVE_CACHE.put(key, curve)
+    return curve
+
+
+_POPULATE_CACHE = LRUCache(maxsize=256)
+
+
+def _populate(time: np.ndarray, survival: np.ndarray, N: int) -> tuple:
+    # add starting point (survival=100, time=0)
+    time = np.append(time, 0)
+    survival = np.append(survival, 100)
+    min_survival = np.nanmin(survival)
+    step = 100 / N
+
+    f = StepCurve(survival, time)  # survival -> time
+    if min_survival <= 0:
+        new_survival = np.linspace(0, 100 - step, N)
+        new_time = f(new_survival)
+    else:
+        existing_n = int(np.round((100 - min_survival) / 100 * N, 0))
+        existing_points = np.linspace(
+            100 * (N - existing_n) / N + step, 100 - step, existing_n)
+
+        # pad patients from [0, min_survival]
+        pad_points = np.linspace(0, 100 * (N - existing_n) / N, N - existing_n)
+        new_time = np.round(np.concatenate((np.full(N - existing_n, np.nanmax(time)), 
+                                            f(existing_points))), 5)
+        new_survival = np.round(np.concatenate((pad_points, existing_points)), 
+                                int(np.ceil(-np.log10(step))))
+    assert new_time.shape[0] == N
+    order = np.argsort(new_survival, kind='stable')
+    return (new_time[order], new_survival[order])
+
+
+def populate_N_patients_arrays(ori_df: pd.DataFrame, N: int) -> tuple:
+    """Scale to make N patients from survival 0 to 100, as read-only arrays.
+    Results are cached by curve content and N, so populating the same arm
+    (e.g. a shared control) again is free.
+
+    Args:
+        ori_df (pd.DataFrame): original survival data
+        N (int): number of patients
+
+    Returns:
+        (np.ndarray, np.ndarray): Time and Survival of N patients in increasing survival
+    """
+    time = ori_df['Time'].to_numpy(dtype=np.float64)
+    survival = ori_df['Survival'].to_numpy(dtype=np.float64)
+    key = (curve_hash(time, survival), N)
+    result = _POPULATE_CACHE.get(key)
+    if result is None:
+        result = _readonly(*_populate(time, survival, N))
+        _POPULATE_CACHE.put(key, result)
+    return result
+
+
 def populate_N_patients(ori_df, N):
     """Scale to make N patients from survival 0 to 100.
 
@@ -21,34 +391,63 @@ def populate_N_patients(ori_df, N):
         Survival data with N data points.
 
     """
-    df = ori_df.copy()
-    # add starting point (survival=100, time=0)
-    df = df.append(pd.DataFrame(
-        {'Survival': 100, 'Time': 0}, index=[df.shape[0]]))
-    min_survival = df['Survival'].min()
-    step = 100 / N
+    time, survival = populate_N_patients_arrays(ori_df, N)
+    return pd.DataFrame({'Time': time, 'Survival': survival})
 
-    f = interpolate(df, x='Survival', y='Time')  # survival -> time
-    if min_survival <= 0:
-        points = np.linspace(0, 100 - step, N)
-        new_df = pd.DataFrame({'Time': f(points), 'Survival': points})
-    else:
-        existing_n = int(np.round((100 - min_survival) / 100 * N, 0))
-        existing_points = np.linspace(
-            100 * (N - existing_n) / N + step, 100 - step, existing_n)
 
-        # pad patients from [0, min_survival]
-        new_df = pd.DataFrame({'Time': df['Time'].max(),
-                               'Survival': np.linspace(0, 100 * (N - existing_n) / N, N - existing_n)})
-        new_df = new_df.append(pd.DataFrame({'Survival': existing_points,
-                                             'Time': f(existing_points)}))
-        new_df = new_df.round(
-            {'Time': 5, 'Survival': int(np.ceil(-np.log10(step)))})
-    assert new_df.shape[0] == N
-    return new_df[['Time', 'Survival']].sort_values('Survival').reset_index(drop=True)
+def sorted_ranks(a):
+    """Tie-averaged ranks (1 to N) of a sorted dataset in O(N).
+    Ties are contiguous in a sorted dataset (e.g. the plateau that populate_N_patients
+    creates at tmax), so each run of equal values gets the average of its positions.
+
+    Args:
+        a (array_like): dataset sorted in ascending or descending order
+
+    Returns:
+        np.ndarray: ranks of the elements of a, in the order of a
+    """
+    a = np.asarray(a)
+    n = len(a)
+    if n == 0:
+        return np.zeros(0)
+    starts = np.flatnonzero(np.r_[True, a[1:] != a[:-1]])
+    lengths = np.diff(np.r_[starts, n])
+    ranks = np.repeat(starts + (lengths + 1) / 2, lengths)
+    if a[0] > a[-1]:  # descending
+        ranks = n + 1 - ranks
+    return ranks
+
+
+def spearman_from_permutations(i1, i2, ranks_a, ranks_b):
+    """Spearman correlation of x1 and x2 where x1[i1] = a and x2[i2] = b, computed
+    directly from the permutation indices without re-ranking x1 and x2.
+    Equivalent to scipy.stats.spearmanr(x1, x2) including ties.
+
+    Args:
+        i1 (np.ndarray): permutation indices of dataset 1, shape (N,) or (R, N)
+        i2 (np.ndarray): permutation indices of dataset 2, same shape as i1
+        ranks_a (np.ndarray): sorted_ranks of sorted dataset 1
+        ranks_b (np.ndarray): sorted_ranks of sorted dataset 2
+
+    Returns:
+        float or np.ndarray: Spearman correlation (one per row if batched)
+    """
+    batched = np.ndim(i1) == 2
+    i1 = np.atleast_2d(i1)
+    i2 = np.atleast_2d(i2)
+    center = (len(ranks_a) + 1) / 2
+    ca = ranks_a - center
+    cb = ranks_b - center
+    r1 = np.empty(i1.shape)
+    r2 = np.empty(i2.shape)
+    np.put_along_axis(r1, i1, ca[np.newaxis, :], axis=1)
+    np.put_along_axis(r2, i2, cb[np.newaxis, :], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rho = (r1 * r2).sum(axis=1) / np.sqrt(np.dot(ca, ca) * np.dot(cb, cb))
+    return rho if batched else rho[0]
 
 
-def fit_rho3(a, b, rho, rng, ori_rho=None):
+def fit_rho3(a, b, rho, rng, ori_rho=None, full_output=False, n_iter=1):
     """ Shuffle data of two sorted dataset to make two dataset to have a desired Spearman correlation.
     Note that a and b should be have the same length.
     Modified from: https://www.mathworks.com/help/stats/generate-correlated-data-using-rank-correlation.html
@@ -59,9 +458,12 @@ def fit_rho3(a, b, rho, rng, ori_rho=None):
         rho (float): desired spearman correlation coefficient
         ori_rho (float): internal argument for recursive part (default: None)
         seed (int): random generator seed
+        full_output (bool): also return the achieved rho and the number of draws (default: False)
+        n_iter (int): internal argument for recursive part (default: 1)
 
     Returns:
-        tuple: tuple of shuffled datsets (np.ndarray)
+        tuple: tuple of shuffled datsets (np.ndarray), followed by achieved rho (float)
+               and number of draws (int) if full_output
 
     """
     if ori_rho is None:
@@ -80,11 +482,257 @@ def fit_rho3(a, b, rho, rng, ori_rho=None):
     x2[i2] = b
 
     # check if desired rho is achieved
-    result, _ = spearmanr(x1, x2)
+    result = spearman_from_permutations(i1, i2, sorted_ranks(a), sorted_ranks(b))
     # recursive until reaches 2 decimal point accuracy
     if ori_rho - result > 0.01:  # aim for higher rho
-        x1, x2 = fit_rho3(a, b, rho + 0.01, rng, ori_rho=ori_rho)
+        return fit_rho3(a, b, rho + 0.01, rng, ori_rho=ori_rho,
+                        full_output=full_output, n_iter=n_iter + 1)
     elif ori_rho - result < -0.01:  # aim for lower rho
-        x1, x2 = fit_rho3(a, b, rho - 0.01, rng, ori_rho=ori_rho)
+        return fit_rho3(a, b, rho - 0.01, rng, ori_rho=ori_rho,
+                        full_output=full_output, n_iter=n_iter + 1)
 
+    if full_output:
+        return (x1, x2, result, n_iter)
     return (x1, x2)
+
+
+def _copula_factor(rho):
+    """Square-root factor of the Gaussian copula correlation matrix for Spearman rho.
+    Uses the same SVD factorization as np.random.Generator.multivariate_normal
+    so that a batched draw reproduces the per-seed draw of fit_rho3.
+
+    Args:
+        rho (float): desired spearman correlation coefficient
+
+    Returns:
+        np.ndarray: (2, 2) factor F such that z @ F has the copula correlation
+    """
+    pearson_r = 2 * np.sin(rho * np.pi / 6)
+    rho_mat = np.array([[1, pearson_r], [pearson_r, 1]])
+    _, s, vh = np.linalg.svd(rho_mat)
+    return np.sqrt(s)[:, None] * vh
+
+
+def fit_rho3_batch(a, b, rho, seeds):
+    """ Vectorized version of fit_rho3 over many random generator seeds.
+    Row k reproduces fit_rho3(a, b, rho, np.random.default_rng(seeds[k])): the same
+    standard normal draws are mapped through a precomputed copula factor, all rows are
+    argsorted at once, and only the rows that miss the target rho are redrawn with
+    the adjusted rho.
+
+    Args:
+        a (array_like): sorted dataset 1
+        b (array_like): sorted dataset 2
+        rho (float): desired spearman correlation coefficient
+        seeds (array_like): random generator seeds (int or np.random.Generator), one per row
+
+    Returns:
+        tuple: tuple of shuffled datasets (np.ndarray of shape (len(seeds), len(a)))
+
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    n = len(a)
+    rngs = [s if isinstance(s, np.random.Generator) else np.random.default_rng(s)
+            for s in seeds]
+    n_rows = len(rngs)
+    x1, x2 = np.zeros((n_rows, n)), np.zeros((n_rows, n))
+
+    ranks_a, ranks_b = sorted_ranks(a), sorted_ranks(b)
+    target = np.full(n_rows, rho, dtype=float)
+    pending = np.arange(n_rows)
+    factors = {}
+    while pending.size > 0:
+        z = np.stack([rngs[k].standard_normal((n, 2)) for k in pending])
+        for r in np.unique(target[pending]):
+            if r not in factors:
+                factors[r] = _copula_factor(r)
+        fac = np.stack([factors[r] for r in target[pending]])
+        u = np.matmul(z, fac)
+        i1 = np.argsort(u[:, :, 0], axis=1)
+        i2 = np.argsort(u[:, :, 1], axis=1)
+        new_x1, new_x2 = np.zeros((pending.size, n)), np.zeros((pending.size, n))
+        np.put_along_axis(new_x1, i1, a[np.newaxis, :], axis=1)
+        np.put_along_axis(new_x2, i2, b[np.newaxis, :], axis=1)
+        x1[pending] = new_x1
+        x2[pending] = new_x2
+
+        # check if desired rho is achieved for every row
+        result = spearman_from_permutations(i1, i2, ranks_a, ranks_b)
+        aim_higher = rho - result > 0.01
+        aim_lower = rho - result < -0.01
+        target[pending[aim_higher]] += 0.01
+        target[pending[aim_lower]] -= 0.01
+        pending = pending[aim_higher | aim_lower]
+
+    return (x1, x2)
+
+
+def fit_rho3_over_rho(a, b, rhos, rng, max_iter=100, ref_rho=None, full_output=False):
+    """ Shuffle two sorted datasets to each of several Spearman correlations using common random numbers.
+    One set of standard normal draws is shared by every rho, so differences between rows come
+    from rho and not from Monte Carlo noise. Rows that miss their target by more than 0.01 are
+    nudged as in fit_rho3 but remixed from the same draws, at most max_iter times.
+    Rows at ref_rho reproduce fit_rho3(a, b, ref_rho, rng): the draws are mixed with the
+    factor of multivariate_normal there, and a miss draws again from rng as fit_rho3 does.
+
+    Args:
+        a (array_like): sorted dataset 1
+        b (array_like): sorted dataset 2
+        rhos (array_like): desired spearman correlation coefficients
+        rng (np.random.Generator): random generator
+        max_iter (int): maximum number of passes (default: 100)
+        ref_rho (float): correlation whose rows reproduce fit_rho3 (default: None)
+        full_output (bool): also return the achieved rho and the number of passes of
+            each row (default: False)
+
+    Returns:
+        tuple: tuple of shuffled datasets (np.ndarray of shape (len(rhos), len(a))),
+               followed by achieved rhos and numbers of passes (np.ndarray) if full_output
+
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    rhos = np.asarray(rhos, dtype=float)
+    n = len(a)
+    z = rng.standard_normal((n, 2))
+    x1, x2 = np.zeros((len(rhos), n)), np.zeros((len(rhos), n))
+
+    ranks_a, ranks_b = sorted_ranks(a), sorted_ranks(b)
+    if ref_rho is None:
+        is_ref = np.zeros(len(rhos), dtype=bool)
+        rotation = np.eye(2)
+    else:
+        is_ref = rhos == ref_rho
+        # orthogonal map of the Cholesky factor onto the SVD factor at ref_rho, so rows
+        # near ref_rho stay close to the reference row
+        rotation = _copula_factor(ref_rho) @ np.linalg.inv(
+            _chol2(2 * np.sin(ref_rho * np.pi / 6)).T)
+    achieved = np.full(len(rhos), np.nan)
+    n_iter = np.zeros(len(rhos), dtype=int)
+    target = rhos.copy()
+    pending = np.flatnonzero(~is_ref)
+    for _ in range(max_iter):
+        if pending.size == 0:
+            break
+        # Cholesky factor is continuous in rho (unlike the SVD factor), so nearby rho
+        # values map the common draws to nearby permutations
+        fac = np.stack([rotation @ _chol2(2 * np.sin(r * np.pi / 6)).T for r in target[pending]])
+        u = np.matmul(z[np.newaxis], fac)
+        i1 = np.argsort(u[:, :, 0], axis=1)
+        i2 = np.argsort(u[:, :, 1], axis=1)
+        new_x1, new_x2 = np.zeros((pending.size, n)), np.zeros((pending.size, n))
+        np.put_along_axis(new_x1, i1, a[np.newaxis, :], axis=1)
+        np.put_along_axis(new_x2, i2, b[np.newaxis, :], axis=1)
+        x1[pending] = new_x1
+        x2[pending] = new_x2
+
+        result = spearman_from_permutations(i1, i2, ranks_a, ranks_b)
+        achieved[pending] = result
+        n_iter[pending] += 1
+        aim_higher = rhos[pending] - result > 0.01
+        aim_lower = rhos[pending] - result < -0.01
+        target[pending[aim_higher]] += 0.01
+        target[pending[aim_lower]] -= 0.01
+        np.clip(target, -1, 1, out=target)
+        pending = pending[aim_higher | aim_lower]
+
+    if is_ref.any():
+        rho = ref_rho
+        for k in range(1, max_iter + 1):
+            u = z @ _copula_factor(rho)
+            i1 = np.argsort(u[:, 0])
+            i2 = np.argsort(u[:, 1])
+            result = spearman_from_permutations(i1, i2, ranks_a, ranks_b)
+            achieved[is_ref] = result
+            n_iter[is_ref] = k
+            if abs(ref_rho - result) <= 0.01:
+                break
+            rho += 0.01 if ref_rho > result else -0.01
+            z = rng.standard_normal((n, 2))
+        x1[np.ix_(is_ref, i1)] = a
+        x2[np.ix_(is_ref, i2)] = b
+
+    if full_output:
+        return (x1, x2, achieved, n_iter)
+    return (x1, x2)
+
+
+def _chol2(r):
+    """Lower Cholesky factor of the 2x2 correlation matrix [[1, r], [r, 1]]."""
+    return np.array([[1, 0], [r, np.sqrt(max(1 - r ** 2, 0))]])
+
+
+def fit_rho_iman_conover(a, b, rho, rng, max_iter=5, tol=0.01):
+    """ Shuffle data of two sorted dataset to have a desired Spearman correlation
+    using Iman-Conover rank correlation induction.
+    Unlike fit_rho3, the random draw is made once: van der Waerden scores are randomly
+    permuted, linearly mixed to the target correlation, and their ranks decide the
+    shuffling. If the achieved rho misses the target, the working correlation is corrected
+    and the same scores are mixed again, for at most max_iter O(N log N) passes.
+    Note that a and b should be have the same length.
+    Reference: Iman & Conover (1982), Commun. Stat. Simul. Comput. 11(3):311-334
+
+    Args:
+        a (array_like): sorted dataset 1
+        b (array_like): sorted dataset 2
+        rho (float): desired spearman correlation coefficient
+        rng (np.random.Generator): random generator
+        max_iter (int): maximum number of correction passes (default: 5)
+        tol (float): accepted absolute difference from rho (default: 0.01)
+
+    Returns:
+        tuple: shuffled datasets (np.ndarray, np.ndarray), achieved rho (float), 
+               number of iterations (int)
+
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    n = len(a)
+    ranks_a, ranks_b = sorted_ranks(a), sorted_ranks(b)
+    scores = norm.ppf(np.arange(1, n + 1) / (n + 1))
+    m = np.column_stack((rng.permutation(scores), rng.permutation(scores)))
+    # remove the sample correlation of the random permutation
+    e = np.corrcoef(m, rowvar=False)[0, 1]
+    m = m @ np.linalg.inv(_chol2(e)).T
+
+    working_rho = rho
+    for n_iter in range(1, max_iter + 1):
+        pearson_r = np.clip(2 * np.sin(working_rho * np.pi / 6), -1, 1)
+        t = m @ _chol2(pearson_r).T
+        i1 = np.argsort(t[:, 0], kind='stable')
+        i2 = np.argsort(t[:, 1], kind='stable')
+        x1, x2 = np.zeros(n), np.zeros(n)
+        x1[i1] = a
+        x2[i2] = b
+        result = spearman_from_permutations(i1, i2, ranks_a, ranks_b)
+        if abs(rho - result) <= tol:
+            break
+        # correction pass
+        working_rho += rho - result
+
+    return (x1, x2, result, n_iter)
+
+
+def shuffle_correlated(a, b, rho, rng, method='recursive', full_output=False):
+    """ Shuffle two sorted datasets to a desired Spearman correlation with the selected method.
+
+    Args:
+        a (array_like): sorted dataset 1
+        b (array_like): sorted dataset 2
+        rho (float): desired spearman correlation coefficient
+        rng (np.random.Generator): random generator
+        method (str): 'recursive' (fit_rho3) or 'iman_conover' (fit_rho_iman_conover)
+        full_output (bool): also return the achieved rho and the number of iterations.
+            Defaults to False.
+
+    Returns:
+        tuple: tuple of shuffled datsets (np.ndarray), followed by achieved rho (float)
+               and number of iterations (int) if full_output
+    """
+    if method == 'recursive':
+        return fit_rho3(a, b, rho, rng, full_output=full_output)
+    elif method == 'iman_conover':
+        result = fit_rho_iman_conover(a, b, rho, rng)
+        return result if full_output else result[:2]
+    raise ValueError(f"method must be one of {CORRELATION_METHODS}, got '{method}'")